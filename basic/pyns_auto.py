@@ -14,6 +14,8 @@ import os  # handy system and path functions
 import sys  # to get file system encoding
 import time
 import logging
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from pyns_send import SyncScheduler
 # import csv #useful for handling csv files
 
 # from psychopy import visual, logging, core, event, data , sound, gui,locale_setup# import some libraries from PsychoPy
@@ -24,11 +26,13 @@ autolog=[]
 import egi.simple as egi 
 ms_localtime = egi.ms_localtime     
 ns = egi.Netstation()
-ns.connect('10.0.0.42', 55513)
+ns_host = '10.0.0.42' # '127.0.0.1' to test against a local stand-in (python pyns_eci.py)
+ns.connect(ns_host, 55513)
 ns.BeginSession()
-ns.sync()
+# resyncs every SYNC_INTERVAL seconds instead of before every event
+scheduler = SyncScheduler(ns)
+scheduler.sync()
 ns.StartRecording()
-ns.sync()
 ns.send_event(key='strt', timestamp=None,pad=False)
 
 print "Imported PyNetstation and connected. Sending 5 'auto' events in +1 second increments. Type beep() for sending custom signal."
@@ -41,15 +45,12 @@ print "Imported PyNetstation and connected. Sending 5 'auto' events in +1 second
 # logFile = logging.LogFile(filename+'.log', level=logging.EXP)
 # logging.console.setLevel(logging.WARNING)  # this outputs to the screen, not a file
 
-ns.sync()
-
 ### Sample function for sending pulse: Type beep() 
 def beep(): 
-	ns.sync()
+	scheduler.before_event()
 	log_time=egi.ms_localtime()
 	# logging.data('beep sent at local time: ' + str(egi.ms_localtime()))
 	print "Beep logged at " + str(log_time)
-	ns.sync()
 	sent_time=egi.ms_localtime()
 	ns.send_event(key='beep', timestamp=None, description='below is sample table', table={'abcd' : 1, 'efgh' : 2}, pad=False)
 	print "Beep sent at " + str(sent_time)
@@ -60,7 +61,7 @@ def beep():
 k = 2
 time.sleep(k) 
 for i in range(0,5):
-	ns.sync()
+	scheduler.before_event()
 	#logging.data('auto: ' + str(egi.ms_localtime()))
 	print "auto logged at " + str(egi.ms_localtime())
 	ns.send_event(key='auto', timestamp=None, description='below is sample table', table={'indx' : i, 'kinc' : k}, pad=False)
@@ -69,6 +70,8 @@ for i in range(0,5):
 	k += 1
 	time.sleep(k)
 
+print "Sync metrics: " + str(scheduler.metrics())
+
 np.savetxt('autolog.csv',autolog,delimiter=',',fmt='%d')
 
 
@@ -23,6 +23,11 @@ from numpy.random import random, randint, normal, shuffle
 import os
 import sys
 import decimal
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from pyns_frames import (SHOW, CUE, PC_ON, PC_OFF, HIDE, compile_block,
+                         blink_cues, openclose_cues, gaze_cues, FrameRecorder)
+from pyns_sound import SoundBank
+from pyns_evlog import EventLog
 #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
 #                       Custom Variables                          #
 #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
@@ -34,7 +39,10 @@ shuffle(seq)
 # Switches #
 netstation  = False       #False to run the file locally without connecting to NetStation
 recording   = False       #True starts recording NetStation automatically
+ns_host     = '10.0.0.42' #'127.0.0.1' to test against a local stand-in (python pyns_eci.py)
 photocell   = True        #True allows use of photocell device
+flip_triggers = True      #True also sends the photocell square onset (wsqS) to NetStation, stamped at the flip
+event_log   = True        #True writes our events to <filename>.events.jsonl (pyns_evlog), off the frame loop
 
 # Duration of blank transition
 dur_iti=10
@@ -69,6 +77,11 @@ shuffle(gaze_seq)
 gaze_seq=temp+gaze_seq
 dur_gaze= (len(gaze_seq)+1)*gaze_isi+(len(gaze_seq)*60)+dur_iti
 
+# Frame schedules: frame -> actions of each block, compiled once (see pyns_frames)
+blink_schedule = compile_block(dur_blink, blink_cues(blink_per_block, blink_isi), 20, dur_whitesquare, dur_iti, photocell)
+openclose_schedule = compile_block(dur_openclose, openclose_cues(oc_seq, openclose_isi), 30, dur_whitesquare, dur_iti, photocell)
+gaze_schedule = compile_block(dur_gaze, gaze_cues(gaze_seq, gaze_isi), 20, dur_whitesquare, dur_iti, photocell)
+
 
 #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
 #                    Initialize Components                        #
@@ -80,6 +93,7 @@ if netstation:
     ms_localtime = egi.ms_localtime
     ns = egi.Netstation()
     print("Imported PyNetstation")
+    from pyns_send import AsyncSender
 
 # Ensure that relative paths start from the same directory as this script
 _thisDir = os.path.dirname(os.path.abspath(__file__))
@@ -106,6 +120,7 @@ thisExp = data.ExperimentHandler(name=expName, version='',
 # save a log file for detail verbose info
 logFile = logging.LogFile(filename+'.log', level=logging.EXP)
 logging.console.setLevel(logging.WARNING)  # this outputs to the screen, not a file
+evlog = EventLog(filename + '.events.jsonl', ms_localtime if netstation else None).start() if event_log else None
 endExpNow = False  # flag for 'escape' or other condition => quit the exp
 
 win = visual.Window(
@@ -114,6 +129,8 @@ win = visual.Window(
     monitor='testMonitor', color=[-1.0,-1.0,-1.0], colorSpace='rgb',
     blendMode='avg', useFBO=True)
 expInfo['frameRate'] = win.getActualFrameRate()
+# flip times of every block, dropped frames are summarized in <filename>_frames.csv
+frames = FrameRecorder(1.0 / expInfo['frameRate'] if expInfo['frameRate'] else None)
 
 # Prepare components
 if photocell:
@@ -181,21 +198,8 @@ blank = visual.TextStim(win=win, name='blank',
     color='white', colorSpace='rgb', opacity=1,
     depth=-1.0);
 
-# Sound Set
-sclo = sound.Sound('./sound/close_speak.wav')
-sclo.setVolume(1)
-sope = sound.Sound('./sound/open_speak.wav')
-sope.setVolume(1)
-sbli = sound.Sound('./sound/blink_speak.wav')
-sbli.setVolume(1)
-slef = sound.Sound('./sound/left_speak.wav')
-slef.setVolume(1)
-srig = sound.Sound('./sound/right_speak.wav')
-srig.setVolume(1)
-s_up = sound.Sound('./sound/up_speak.wav')
-s_up.setVolume(1)
-sdow = sound.Sound('./sound/down_speak.wav')
-sdow.setVolume(1)
+# Sound Set: the cue files (sound/ of the repository) are decoded in the background during the align/intro routines
+bank = SoundBank(os.path.join(_thisDir, '..', 'sound')).start()
 
 esc = visual.TextStim(win=win, name='esc',
     text="End of test\n\nPress 'esc'",
@@ -221,6 +225,53 @@ def hide_screen():
     right.setAutoDraw(False)
     up.setAutoDraw(False)
     down.setAutoDraw(False)
+    if netstation:
+        sender.idle()  # ITI: resync the clocks now if the last sync is getting old
+def send_to_NS(key, frameN=None):
+    # logs the event and queues it with the current time, the sender thread does the network round-trips
+    frames.note(key)
+    if netstation:
+        if frameN is None:
+            logging.data(key)
+        else:
+            logging.data(key + ' | frame count: ' + str(frameN))
+        sender.send(key, frame=frameN)
+    elif evlog is not None:
+        evlog.event(key, frame=frameN)
+def flip_event(key):
+    # logs (and sends) key when the next win.flip() puts the frame on screen
+    win.logOnFlip(key, level=logging.DATA)
+    frames.note(key)
+    if netstation and flip_triggers:
+        sender.send_on_flip(win, key)
+    elif evlog is not None:
+        win.callOnFlip(log_flip, key)
+def log_flip(key):
+    # event log record of a frame that just reached the screen
+    ms = evlog.clock()
+    evlog.event(key, ms, flip=ms)
+def run_block(name, schedule, n_frames):
+    # plays a compiled block: one dict lookup per frame; returns the last frame number
+    frames.start_block(name)
+    for frameN in range(1, n_frames + 1):
+        frames.flip(win.flip())
+        for action in schedule.get(frameN, ()):
+            if action[0] == CUE:
+                sounds[action[1]].play()
+                send_to_NS(action[1], frameN if action[2] else None)
+            elif action[0] == PC_ON:
+                whitesquare.setAutoDraw(True)
+                flip_event('wsqS')
+            elif action[0] == PC_OFF:
+                whitesquare.setAutoDraw(False)
+            elif action[0] == SHOW:
+                show_screen()
+            elif action[0] == HIDE:
+                hide_screen()
+    summary = frames.end_block()
+    if summary['dropped']:
+        logging.warning(name + ': ' + str(summary['dropped']) + ' dropped frames (' + summary['drop_events'] + ')')
+    return n_frames
 
 # ------Prepare to start Routine "align"-------
 if photocell:
@@ -311,20 +362,18 @@ for thisComponent in introComponents:
         thisComponent.status = NOT_STARTED
 # NetStation
 if netstation:
-    ns.connect('10.0.0.42', 55513)
+    ns.connect(ns_host, 55513)
     ns.BeginSession()
     print("Connected to Netstation")
     if recording:
         ns.StartRecording()
         print("Recording ...")
+    sender = AsyncSender(ns, ms_localtime, log=evlog).start()
 
 # -------Start Routine "intro"-------
 
 ### NetStation ###
-if netstation:
-    ns.sync()
-    logging.data('intS' + ' | frame count: ' + str(frameN))
-    ns.send_event(key='intS', timestamp=None,pad=False)
+send_to_NS('intS', frameN)
 
 while continueRoutine:
     # get current time
@@ -392,10 +441,13 @@ thisExp.nextEntry()
 routineTimer.reset()
 
 ### NetStation ###
-if netstation:
-    ns.sync()
-    logging.data('intE' + ' | frame count: ' + str(frameN))
-    ns.send_event(key='intE', timestamp=None,pad=False)
+send_to_NS('intE', frameN)
+
+# cues built once from memory, the blocks below do no disk I/O
+sounds = {'sbli': bank.sound('blink_speak'), 'sclo': bank.sound('close_speak'), 'sope': bank.sound('open_speak'),
+          'slef': bank.sound('left_speak'), 'srig': bank.sound('right_speak'), 's_up': bank.sound('up_speak'),
+          'sdow': bank.sound('down_speak')}
+logging.info('sound bank: ' + str(bank.report()))
 
 #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
 #                       Experiment Loop                           #
@@ -403,183 +455,36 @@ if netstation:
 for trial in range(len(seq)):
     # check for blinks
     if seq[trial] == 1:
-        t = 0
         openClock.reset()
         frameN = -1
-        sclo.setSound('./sound/blink_speak.wav')
-        blink_interval=[]
-        pc_start=[]
-        pc_end=[]
-
-        if netstation:
-            ns.sync()
-            logging.data('bliS' + ' | frame count: ' + str(frameN))
-            ns.send_event(key='bliS', timestamp=None,pad=False)
-
-        for frameN in range(dur_blink):
-            t = openClock.getTime()
-            frameN = frameN + 1
-            win.flip()
-            show_screen()
-
-            for i in range(blink_per_block+1):
-                if frameN == blink_isi * i + (60 * (i-1)):
-                    sbli.play()
-                    if netstation:
-                        ns.sync()
-                        logging.data('sbli' + ' | frame count: ' + str(frameN))
-                        ns.send_event(key='sbli', timestamp=None,pad=False)
-                    blink_interval.append(frameN)
-                    pc_start=[x+20 for x in blink_interval]
-                    pc_end=[x+dur_whitesquare for x in pc_start]
-            if photocell:
-                for i in range(len(pc_start)):
-                    if frameN == pc_start[i]:
-                        whitesquare.setAutoDraw(True)
-                        logging.data('wsqS')
-                for i in range(len(pc_end)):
-                    if frameN == pc_end[i]:
-                        whitesquare.setAutoDraw(False)
-            if dur_blink-frameN < dur_iti:
-                hide_screen()
-
+        send_to_NS('bliS', frameN)
+        frameN = run_block('blink', blink_schedule, dur_blink)
         if endExpNow or event.getKeys(keyList=["escape"]):
             core.quit()
         routineTimer.reset()
-        if netstation:
-            ns.sync()
-            logging.data('bliE' + ' | frame count: ' + str(frameN))
-            ns.send_event(key='bliE', timestamp=None,pad=False)
+        send_to_NS('bliE', frameN)
 
     # check for open/close
     if seq[trial] == 2:
-        t = 0
         closeClock.reset()
         frameN = -1
-        sclo.setSound('./sound/close_speak.wav')
-        sope.setSound('./sound/open_speak.wav')
-        oc_interval=[]
-        pc_start=[]
-        pc_end=[]
-
-        if netstation:
-            ns.sync()
-            logging.data('oc_S' + ' | frame count: ' + str(frameN))
-            ns.send_event(key='oc_S', timestamp=None,pad=False)
-
-        for frameN in range(dur_openclose):
-            t = closeClock.getTime()
-            frameN = frameN + 1
-            win.flip()
-            show_screen()
-
-            for i in range(1,len(oc_seq)+1):
-                if frameN == openclose_isi * i + (60 * (i - 1)):
-                    if i % 2 != 0: # check for odd seq
-                        sclo.play()
-                        if netstation:
-                            ns.sync()
-                            logging.data('sclo' + ' | frame count: ' + str(frameN))
-                            ns.send_event(key='sclo', timestamp=None,pad=False)
-                    if i % 2 == 0: # check for even seq
-                        sope.play()
-                        if netstation:
-                            ns.sync()
-                            logging.data('sope' + ' | frame count: ' + str(frameN))
-                            ns.send_event(key='sope', timestamp=None,pad=False)
-                    oc_interval.append(frameN)
-                    pc_start=[x+30 for x in oc_interval]
-                    pc_end=[x+dur_whitesquare for x in pc_start]
-            if photocell:
-                for i in range(len(pc_start)):
-                    if frameN == pc_start[i]:
-                        whitesquare.setAutoDraw(True)
-                        logging.data('wsqS')
-                for i in range(len(pc_end)):
-                    if frameN == pc_end[i]:
-                        whitesquare.setAutoDraw(False)
-            if dur_openclose-frameN < dur_iti:
-                hide_screen()
-
+        send_to_NS('oc_S', frameN)
+        frameN = run_block('openclose', openclose_schedule, dur_openclose)
         if endExpNow or event.getKeys(keyList=["escape"]):
             core.quit()
         routineTimer.reset()
-        if netstation:
-            ns.sync()
-            logging.data('oc_E' + ' | frame count: ' + str(frameN))
-            ns.send_event(key='oc_E', timestamp=None,pad=False)
-
+        send_to_NS('oc_E', frameN)
 
     # check for gaze
     if seq[trial] == 3:
-        t = 0
         gazeClock.reset()
         frameN = -1
-        slef.setSound('./sound/left_speak.wav')
-        srig.setSound('./sound/right_speak.wav')
-        s_up.setSound('./sound/up_speak.wav')
-        sdow.setSound('./sound/down_speak.wav')
-        gaze_interval=[]
-        pc_start=[]
-        pc_end=[]
-
-        if netstation:
-            ns.sync()
-            logging.data('gazS' + ' | frame count: ' + str(frameN))
-            ns.send_event(key='gazS', timestamp=None,pad=False)
-
-        for frameN in range(dur_gaze):
-            t = gazeClock.getTime()
-            frameN = frameN + 1
-            win.flip()
-            show_screen()
-            for i in range(1,len(gaze_seq)):
-                if frameN == gaze_isi * i + (60 * (i - 1)):
-                    if gaze_seq[i]=='l':
-                        slef.play()
-                        if netstation:
-                            ns.sync()
-                            logging.data('slef')
-                            ns.send_event(key='slef', timestamp=None,pad=False)
-                    if gaze_seq[i]=='r':
-                        srig.play()
-                        if netstation:
-                            ns.sync()
-                            logging.data('srig')
-                            ns.send_event(key='srig', timestamp=None,pad=False)
-                    if gaze_seq[i]=='u':
-                        s_up.play()
-                        if netstation:
-                            ns.sync()
-                            logging.data('s_up')
-                            ns.send_event(key='s_up', timestamp=None,pad=False)
-                    if gaze_seq[i]=='d':
-                        sdow.play()
-                        if netstation:
-                            ns.sync()
-                            logging.data('sdow')
-                            ns.send_event(key='sdow', timestamp=None,pad=False)
-                    gaze_interval.append(frameN)
-                    pc_start=[x+20 for x in gaze_interval]
-                    pc_end=[x+dur_whitesquare for x in pc_start]
-            if photocell:
-                for i in range(len(pc_start)):
-                    if frameN == pc_start[i]:
-                        whitesquare.setAutoDraw(True)
-                        logging.data('wsqS')
-                for i in range(len(pc_end)):
-                    if frameN == pc_end[i]:
-                        whitesquare.setAutoDraw(False)
-            if dur_gaze-frameN < dur_iti:
-                hide_screen()
-
+        send_to_NS('gazS', frameN)
+        frameN = run_block('gaze', gaze_schedule, dur_gaze)
         if endExpNow or event.getKeys(keyList=["escape"]):
             core.quit()
         routineTimer.reset()
-        if netstation:
-            ns.sync()
-            logging.data('gazE' + ' | frame count: ' + str(frameN))
-            ns.send_event(key='gazE', timestamp=None,pad=False)
+        send_to_NS('gazE', frameN)
 
 # ------Prepare to start Routine "end"-------
 t = 0
@@ -634,13 +539,16 @@ for thisComponent in endComponents:
 routineTimer.reset()
 
 # NetStation
+send_to_NS('endE', frameN)
 if netstation:
-    ns.sync()
-    logging.data('endE' + ' | frame count: ' + str(frameN))
-    ns.send_event(key='endE', timestamp=None,pad=False)
+    sender.close()
+    print('NetStation sync: ' + str(sender.scheduler.metrics()))
+if evlog is not None:
+    evlog.close()
 
 # these shouldn't be strictly necessary (should auto-save)
 thisExp.saveAsWideText(filename+'.csv')
+frames.write_summary(filename + '_frames.csv')
 thisExp.saveAsPickle(filename)
 logging.flush()
 # make sure everything is closed down
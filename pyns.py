@@ -0,0 +1,131 @@
+"""
+Command line entry point of the pyns analyses.
+
+	python -m pyns diff PYLOG NSLOG [TAG ...] [--filter data]
+	python -m pyns pc PYLOG NSLOG [TAG ...] [--pc-tag wsq]
+	python -m pyns batch DATA_DIR [TAG ...] [--pc-tag wsq] [--workers N] [--summary summary.csv]
+
+Common options: --json (one json document on stdout, warnings go to stderr),
+--no-cache (skip the pyns_cache disk cache), --profile FILE (write the pyns_profile report as json).
+
+Only argparse is imported up front: numpy and the analysis modules are imported by the subcommand
+that needs them, so 'python -m pyns --help' starts fast (see 'python pyns_bench.py startup').
+
+Example:
+	python -m pyns diff example_pylog example_nslog int bli sbl oc_ scl sop gaz sle sri s_u sdo
+	python -m pyns pc example_pylog example_nslog sbl scl sop sle sri s_u sdo --json
+"""
+from __future__ import print_function
+import argparse
+import sys
+
+
+def plain(value):
+	"""value with numpy arrays/scalars turned into lists/floats, for json output."""
+	if hasattr(value,'tolist'):
+		return value.tolist()
+	if isinstance(value,(list,tuple)):
+		return [plain(item) for item in value]
+	if isinstance(value,dict):
+		return dict((key,plain(item)) for key,item in value.items())
+	return value
+
+
+def run_diff(args):
+	"""diff subcommand: PY-NS timing comparison of pyns_run.pyns_diff."""
+	from pyns_session import open_session
+	session=open_session(args.pylog,args.nslog,not args.no_cache)
+	diff_py,diff_ns,avg=session.diff(args.filter,*args.tags)
+	fit=session.clock(args.filter,*args.tags)
+	if not args.json:
+		print('PsychoPy timing differences: ' + str(diff_py.tolist()))
+		print('NetStation timing differences: ' + str(diff_ns.tolist()))
+		print("Average Psychopy-Netstation: " + str(avg) + " ms")
+		print("Clock fit: offset " + str(fit['offset']) + " ms, drift " + str(fit['drift_ppm']) + " ppm, residual " +
+			str(fit['residual_scale']) + " ms (max " + str(fit['residual_max']) + " ms)")
+	result={'pylog':args.pylog,'nslog':args.nslog,'tags':args.tags,'n_events':len(diff_py)+1 if len(diff_py) else 0,
+		'diff_py':diff_py,'diff_ns':diff_ns,'avg_diff':avg}
+	result.update(fit)
+	return result
+
+
+def run_pc(args):
+	"""pc subcommand: photocell timing of pyns_run.pyns_pc."""
+	from pyns_session import open_session
+	avg_pypc,avg_nspc=open_session(args.pylog,args.nslog,not args.no_cache).pc(args.pc_tag,*args.tags)
+	if not args.json:
+		print('Average PsychoPy photocell timing diff: ' + str(avg_pypc) + ' ms')
+		print('Average NetStation photocell timing diff: ' + str(avg_nspc) + ' ms')
+	return {'pylog':args.pylog,'nslog':args.nslog,'tags':args.tags,'avg_pypc':avg_pypc,'avg_nspc':avg_nspc}
+
+
+def run_batch(args):
+	"""batch subcommand: every session under a data directory, see pyns_batch."""
+	import pyns_batch
+	results=pyns_batch.run_batch(args.root,args.tags,args.pc_tag,args.filter,args.workers,not args.no_cache)
+	if args.summary:
+		pyns_batch.write_summary(results,args.summary)
+	if not args.json:
+		for summary in results:
+			print('%s: avg diff %s ms, drift %s ppm, photocell %s / %s ms, %s warnings%s' % (summary['session'],
+				summary['avg_diff'],summary['drift_ppm'],summary['avg_pypc'],summary['avg_nspc'],summary['warnings'],
+				', ERROR ' + summary['error'] if summary['error'] else ''))
+	return {'sessions':results}
+
+
+def parser():
+	"""argparse parser of the diff / pc / batch subcommands."""
+	main=argparse.ArgumentParser(prog='python -m pyns',description='PsychoPy - NetStation timing analyses')
+	common=argparse.ArgumentParser(add_help=False)
+	common.add_argument('--json',action='store_true',help='print one json document on stdout (warnings on stderr)')
+	common.add_argument('--no-cache',action='store_true',help='do not read/write the pyns_cache disk cache')
+	common.add_argument('--profile',metavar='FILE',help='write per stage timings (pyns_profile) to FILE as json')
+	common.add_argument('--filter',default='data',help="PsychoPy log level of the events (default 'data')")
+	commands=main.add_subparsers(dest='command')
+	commands.required=True
+	diff=commands.add_parser('diff',parents=[common],help='PY-NS timing differences of one session')
+	diff.add_argument('pylog',help='PsychoPy log without the .log extension')
+	diff.add_argument('nslog',help='NetStation event export')
+	diff.add_argument('tags',nargs='*',help='three letter event tags')
+	diff.set_defaults(run=run_diff)
+	pc=commands.add_parser('pc',parents=[common],help='photocell timing of one session')
+	pc.add_argument('pylog',help='PsychoPy log without the .log extension')
+	pc.add_argument('nslog',help='NetStation event export')
+	pc.add_argument('tags',nargs='*',help='three letter event tags')
+	pc.add_argument('--pc-tag',default='wsq',help="PsychoPy photocell tag (default 'wsq')")
+	pc.set_defaults(run=run_pc)
+	batch=commands.add_parser('batch',parents=[common],help='every session under a data directory')
+	batch.add_argument('root',help='data directory')
+	batch.add_argument('tags',nargs='*',help='three letter event tags')
+	batch.add_argument('--pc-tag',default=None,help='PsychoPy photocell tag (default: no photocell analysis)')
+	batch.add_argument('--workers',type=int,default=None,help='worker processes (default one per core, 1 = in process)')
+	batch.add_argument('--summary',metavar='CSV',help='also write the summaries to CSV')
+	batch.set_defaults(run=run_batch)
+	return main
+
+
+def main(argv=None):
+	"""Runs one subcommand; returns the process exit status."""
+	args=parser().parse_args(argv)
+	if args.profile:
+		import pyns_profile
+		pyns_profile.enable()
+	stdout=sys.stdout
+	if args.json:
+		#warnings printed by the analyses must not break the json document
+		sys.stdout=sys.stderr
+	try:
+		result=args.run(args)
+	finally:
+		sys.stdout=stdout
+	if args.profile:
+		pyns_profile.write_json(args.profile)
+	if args.json:
+		import json
+		json.dump(plain(result),sys.stdout,indent=1,sort_keys=True)
+		print()
+	return 1 if any(summary['error'] for summary in result.get('sessions',[])) else 0
+
+
+if __name__ == '__main__':
+	sys.exit(main())
@@ -0,0 +1,107 @@
+"""
+Clock alignment between the stimulus (PsychoPy) machine and the amp (NetStation) clock.
+
+average_diff compares consecutive intervals, which cannot tell a constant offset from a slow
+linear drift of one clock against the other. fit_clock fits
+
+	ns_onset = offset + slope * py_onset
+
+on matched event onsets (ms) with a robust estimator, so a few late/dropped events do not bend the line:
+	- 'huber':  iteratively reweighted least squares with Huber weights (default)
+	- 'ransac': best line through random pairs of events, refit on its inliers
+
+and reports the offset (ms), the drift in ppm ((slope - 1) * 1e6) and the residual latency of every event.
+
+Example:
+	py = filter_pyevent(filter_pylog('test2','data'),'sbl','scl','sop')
+	ns = filter_nsevent(filter_nslog('test1'),'sbl','scl','sop')
+	fit = fit_clock(py.onset, ns.onset)
+	print(fit.offset, fit.drift_ppm, fit.residual)
+"""
+from __future__ import division
+from collections import namedtuple
+import numpy as np
+
+#Huber tuning constant (95% efficiency on normal residuals), in units of the residual scale
+HUBER_K=1.345
+RANSAC_ITER=200
+#residual (ms) under which an event counts as RANSAC inlier
+RANSAC_TOL=5.0
+
+ClockFit=namedtuple('ClockFit',['offset','slope','drift_ppm','residual','inlier','scale'])
+
+
+def robust_scale(residual):
+	"""Normalized median absolute deviation of the residuals (never 0)."""
+	mad=np.median(np.abs(residual-np.median(residual)))*1.4826
+	return mad if mad > 1e-9 else max(float(np.std(residual)),1e-9)
+
+
+def weighted_line(x,y,weight):
+	"""Weighted least squares fit of y = a + b*x, returns (a, b)."""
+	sw=np.sqrt(weight)
+	design=np.column_stack([sw,sw*x])
+	(a,b)=np.linalg.lstsq(design,sw*y,rcond=None)[0]
+	return a,b
+
+
+def fit_huber(x,y,max_iter=50,tol=1e-9):
+	"""IRLS with Huber weights: residuals beyond HUBER_K scales are down-weighted by 1/|r|."""
+	weight=np.ones(len(x))
+	a,b=weighted_line(x,y,weight)
+	for i in range(max_iter):
+		residual=y-(a+b*x)
+		limit=HUBER_K*robust_scale(residual)
+		weight=np.minimum(1.0,limit/np.maximum(np.abs(residual),1e-12))
+		a_new,b_new=weighted_line(x,y,weight)
+		done=abs(a_new-a) < tol*max(1.0,abs(a)) and abs(b_new-b) < tol
+		a,b=a_new,b_new
+		if done:
+			break
+	return a,b,weight >= 1.0
+
+
+def fit_ransac(x,y,n_iter=RANSAC_ITER,tol=RANSAC_TOL,seed=0):
+	"""Line through the random event pair with most inliers (|residual| <= tol), refit on those inliers."""
+	rng=np.random.RandomState(seed)
+	first=rng.randint(0,len(x),n_iter)
+	second=rng.randint(0,len(x),n_iter)
+	usable=x[first] != x[second]
+	best=None
+	for i,j in zip(first[usable],second[usable]):
+		b=(y[j]-y[i])/(x[j]-x[i])
+		inlier=np.abs(y-(y[i]+b*(x-x[i]))) <= tol
+		count=np.count_nonzero(inlier)
+		if best is None or count > best[0]:
+			best=(count,inlier)
+	inlier=best[1] if best is not None and best[0] >= 2 else np.ones(len(x),dtype=bool)
+	a,b=weighted_line(x,y,inlier.astype(np.float64))
+	return a,b,inlier
+
+
+def fit_clock(py_onset,ns_onset,method='huber'):
+	"""
+	Syntax: fit_clock(matched PsychoPy onsets in ms, matched NetStation onsets in ms, method='huber' or 'ransac')
+	Example: fit_clock(py.onset, ns.onset)
+
+	Robust fit of ns_onset = offset + slope * py_onset on matched events (same length, same order).
+	Returns ClockFit(offset ms, slope, drift_ppm, residual ms per event, inlier mask, residual scale ms).
+	"""
+	py_onset=np.asarray(py_onset,dtype=np.float64)
+	ns_onset=np.asarray(ns_onset,dtype=np.float64)
+	if len(py_onset) != len(ns_onset):
+		raise ValueError("py_onset and ns_onset must hold the same (matched) events")
+	if len(py_onset) < 2:
+		raise ValueError("at least two matched events are needed to fit the clocks")
+	#center both axes so the intercept does not swamp the slope numerically
+	x0,y0=py_onset.mean(),ns_onset.mean()
+	x,y=py_onset-x0,ns_onset-y0
+	if method == 'huber':
+		a,b,inlier=fit_huber(x,y)
+	elif method == 'ransac':
+		a,b,inlier=fit_ransac(x,y)
+	else:
+		raise ValueError("method must be 'huber' or 'ransac'")
+	residual=y-(a+b*x)
+	offset=y0+a-b*x0
+	return ClockFit(offset,b,(b-1.0)*1e6,residual,inlier,robust_scale(residual[inlier]))
@@ -0,0 +1,124 @@
+"""
+Batch mode: analyse every session under a data/ directory with a process pool.
+
+pyns_exp.py writes one data/<exp>_<subj>/ folder per participant holding <exp>_<subj>.log;
+the NetStation event export of the session is saved into the same folder.
+discover_sessions pairs every PsychoPy .log with the NetStation export found next to it
+(recognised by its 'Time Mode:' header), and run_batch fans the analysis of each pair out
+over a ProcessPoolExecutor.
+
+Results come back in discovery order (sorted by path), one summary dict per session.
+A session that fails does not stop the batch: its 'error' field holds the exception instead.
+While pyns_profile is enabled, the stages recorded by the workers are sent back with the summaries
+and added to the pyns_profile records of this process (each tagged with its session).
+
+Example:
+	results = run_batch('data', ['int','bli','sbl','oc_','scl','sop','gaz'], pc_tag='wsq')
+	write_summary(results, 'data/summary.csv')
+"""
+from __future__ import print_function
+import csv
+import io
+import os
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
+import pyns_profile
+from pyns_session import PynsSession
+
+SUMMARY_FIELDS=['session','pylog','nslog','n_py','n_ns','avg_diff','offset','drift_ppm','residual_scale','residual_max',
+	'avg_pypc','avg_nspc','warnings','error']
+
+
+def is_nslog(path):
+	"""True if path looks like a NetStation event export (header: 'Recording ...' / 'Time Mode: ...')."""
+	try:
+		with open(path,'rb') as nsFile:
+			head=nsFile.read(256)
+	except (IOError,OSError):
+		return False
+	return b'\nTime Mode:' in head
+
+
+def discover_sessions(root):
+	"""
+	Syntax: discover_sessions('string of data directory')
+	Example: discover_sessions('data') --> [('eog_blinks_001/eog_blinks_001', 'data/eog_blinks_001/eog_blinks_001', 'data/eog_blinks_001/nslog'), ...]
+
+	Returns (session name, PsychoPy log w/o extension, NetStation export) for every .log under root
+	with an export in the same folder (the first one, by name), sorted by path.
+	Logs without an export next to them are skipped.
+	"""
+	sessions=[]
+	for folder,dirs,files in os.walk(str(root)):
+		dirs.sort()
+		files=sorted(files)
+		nslogs=[name for name in files if not name.endswith('.log') and is_nslog(os.path.join(folder,name))]
+		if not nslogs:
+			continue
+		for name in files:
+			if name.endswith('.log'):
+				pylog=os.path.join(folder,name[:-4])
+				sessions.append((os.path.relpath(pylog,str(root)),pylog,os.path.join(folder,nslogs[0])))
+	return sessions
+
+
+def analyse_session(job):
+	"""
+	Analyses one (session name, pylog, nslog, event_tags, pc_tag, filter_py, cache, profile) job.
+	Runs in a worker process; printed warnings are counted instead of written to the console,
+	and any exception is returned in the 'error' field.
+	With profile, the pyns_profile records of the job are returned in the 'profile' field.
+	"""
+	name,pylog,nslog,event_tags,pc_tag,filter_py,cache,profile=job
+	summary=dict((field,None) for field in SUMMARY_FIELDS)
+	summary.update(session=name,pylog=pylog,nslog=nslog)
+	if profile:
+		pyns_profile.enable()
+	first=len(pyns_profile.RECORDS)
+	printed=io.StringIO()
+	try:
+		with redirect_stdout(printed):
+			session=PynsSession(pylog,nslog,cache)
+			summary['n_py']=len(session.pytable(filter_py))
+			summary['n_ns']=len(session.nstable)
+			summary['avg_diff']=session.diff(filter_py,*event_tags)[2]
+			summary.update(session.clock(filter_py,*event_tags))
+			if pc_tag:
+				summary['avg_pypc'],summary['avg_nspc']=session.pc(pc_tag,*event_tags)
+	except Exception:
+		summary['error']=traceback.format_exc().strip().splitlines()[-1]
+	summary['warnings']=printed.getvalue().count('WARNING')
+	if profile:
+		summary['profile']=[dict(record,session=name) for record in pyns_profile.RECORDS[first:]]
+		del pyns_profile.RECORDS[first:]
+	return summary
+
+
+def run_batch(root,event_tags,pc_tag=None,filter_py='data',workers=None,cache=True):
+	"""
+	Syntax: run_batch('string of data directory', [event tags], pc_tag='wsq' or None, filter_py='data', workers=None, cache=True)
+
+	Analyses every session found by discover_sessions on a ProcessPoolExecutor
+	(workers=None uses one process per core, workers=1 runs in this process).
+	cache=False parses every log without the pyns_cache disk cache.
+	Returns the summary dicts in discovery order.
+	"""
+	profile=pyns_profile.ENABLED
+	jobs=[(name,pylog,nslog,tuple(event_tags),pc_tag,filter_py,cache,profile) for name,pylog,nslog in discover_sessions(root)]
+	if workers == 1:
+		results=[analyse_session(job) for job in jobs]
+	else:
+		with ProcessPoolExecutor(max_workers=workers) as pool:
+			results=list(pool.map(analyse_session,jobs))
+	for summary in results:
+		pyns_profile.RECORDS.extend(summary.pop('profile',None) or [])
+	return results
+
+
+def write_summary(results,path):
+	"""Writes the run_batch summaries to a csv table."""
+	with open(path,'w',newline='') as out:
+		writer=csv.DictWriter(out,fieldnames=SUMMARY_FIELDS)
+		writer.writeheader()
+		writer.writerows(results)
@@ -0,0 +1,251 @@
+"""
+Benchmarks for the pyns_core analysis pipeline.
+
+bench_filter: cost of filter_event as the number of requested event tags grows.
+The prefix index is built once per table: few tags cost O(M log k) for M selected rows (per row cost
+grows slowly with the number of tags k), many tags one O(N) pass, so the time per call levels off at
+about one scan of the table (the old per-tag loops scanned the whole log once per tag).
+
+bench_pipeline: wall time and peak (traced) memory of every stage, from text_to_csv to photocell_*,
+on synthetic sessions of growing size written by pyns_synth. Results can be saved as a json baseline
+and later runs compared against it; stages slower than REGRESSION_RATIO x baseline are flagged.
+bench_baseline.json holds the reference run (1000 / 10000 / 100000 events) to compare against.
+
+bench_match: share of events match_events pairs correctly on synthetic sessions with clock drift,
+dropped NS events and extra NS rows; every kept event must be matched to its own counterpart.
+
+bench_startup: cold start of the command line entry point ('python -m pyns --help' and of importing
+pyns_run) in a fresh interpreter, best of several runs; the CLI must start within STARTUP_TARGET_MS.
+
+Example:
+	python pyns_bench.py                                  # filter benchmark
+	python pyns_bench.py pipeline 1000 10000 100000 --save bench_baseline.json
+	python pyns_bench.py pipeline 1000 10000 100000 --compare bench_baseline.json
+	python pyns_bench.py match                            # exits 1 if an event is lost or mismatched
+	python pyns_bench.py startup                          # exits 1 above STARTUP_TARGET_MS
+"""
+from __future__ import division, print_function
+import io
+import json
+import os
+import shutil
+import string
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+import tracemalloc
+from contextlib import redirect_stdout
+import numpy as np
+import pyns_core as pyns
+import pyns_synth
+from pyns_align import fit_clock
+from pyns_match import match_events, match_tables
+from text_to_csv import text_to_csv
+
+#a stage this many times slower than the baseline is reported as a regression
+REGRESSION_RATIO=1.5
+#cold start budget of 'python -m pyns --help' on top of a bare interpreter start
+STARTUP_TARGET_MS=100
+STARTUP_COMMANDS=[('interpreter',['-c','pass']),('pyns --help',['-m','pyns','--help']),
+	('import pyns_run',['-c','import pyns_run'])]
+PC_TAGS=('sbl','scl','sop','sle','sri','s_u','sdo')
+#(events, drift ppm, share of NS events dropped, share of extra NS rows) of the match check
+MATCH_CASES=[(4800,0,0.0,0.0),(4800,50,0.0,0.0),(4800,100,0.0,0.0),(4800,100,0.02,0.02),(100000,30,0.0,0.0),
+	(100000,30,0.01,0.01)]
+
+
+def random_table(n_events, n_prefixes=40, seed=0):
+	"""
+	Example: random_table(100000)
+
+	EventTable of n_events PsychoPy-like events with n_prefixes distinct 4 letter tags, ~1.5 s apart.
+	"""
+	rng=np.random.RandomState(seed)
+	letters=list(string.ascii_lowercase)
+	tags=[''.join(rng.choice(letters,4)) for i in range(n_prefixes)]
+	onset=np.cumsum(rng.uniform(500,2500,n_events))
+	labels=np.array(tags)[rng.randint(0,n_prefixes,n_events)]
+	return pyns.EventTable.from_events(onset,labels,pyns.SOURCE_PY)
+
+
+def bench_filter(n_events=100000, tag_counts=(1,2,4,8,11,16,32), repeat=5):
+	"""
+	Example: bench_filter(100000)
+
+	Times filter_event on one table with a growing number of event tags.
+	Returns a list of (number of tags, rows selected, best ms per call).
+	"""
+	table=random_table(n_events)
+	table.prefix_index()
+	results=[]
+	for count in tag_counts:
+		tags=table.prefixes[:count]
+		best=min(timeit.repeat(lambda: pyns.filter_event(table,*tags),number=1,repeat=repeat))
+		results.append((count,len(pyns.filter_event(table,*tags)),round(best*1000,3)))
+	return results
+
+
+def measure(function,*args):
+	"""
+	Runs function(*args) twice, with its printed output discarded: once timed, once under tracemalloc
+	(which slows Python allocations down too much to time the same run).
+	Returns (result, wall ms, peak traced MB, error string or None).
+	"""
+	with redirect_stdout(io.StringIO()):
+		start=time.perf_counter()
+		try:
+			result,error=function(*args),None
+		except Exception as exception:
+			return None,0.0,0.0,type(exception).__name__ + ': ' + str(exception)
+		wall=(time.perf_counter()-start)*1000
+		tracemalloc.start()
+		try:
+			function(*args)
+			peak=tracemalloc.get_traced_memory()[1]/2**20
+		finally:
+			tracemalloc.stop()
+	return result,round(wall,3),round(peak,3),error
+
+
+def bench_pipeline(sizes=(1000,10000,100000),exp_ratio=20,folder=None):
+	"""
+	Example: bench_pipeline((1000, 10000))
+
+	Writes one synthetic session per size (pyns_synth.write_session, isi shrunk so long runs fit in
+	the NetStation time format) and times every pipeline stage on it.
+	Returns {size: {stage: {'ms', 'mb', 'error'}}} (sizes as strings, ready for json).
+	"""
+	folder=folder or tempfile.mkdtemp(prefix='pyns_bench_')
+	report={}
+	try:
+		for size in sizes:
+			isi=min(1500.0,0.9*pyns_synth.MAX_NS_MS/max(size,1))
+			pylog,nslog=pyns_synth.write_session(os.path.join(folder,'synth_%d' % size),size,exp_ratio=exp_ratio,isi=isi)
+			stages={}
+
+			def run(stage,function,*args):
+				result,wall,peak,error=measure(function,*args)
+				stages[stage]={'ms':wall,'mb':peak,'error':error}
+				return result
+
+			run('text_to_csv',text_to_csv,nslog,pylog)
+			run('read_pylog',lambda: sum(1 for row in pyns.read_pylog(pylog + '.log','data')))
+			py=run('filter_pylog',pyns.filter_pylog,pylog,'data')
+			ns=run('filter_nslog',pyns.filter_nslog,nslog)
+			py_event=run('filter_pyevent',pyns.filter_pyevent,py,*PC_TAGS)
+			ns_event=run('filter_nsevent',pyns.filter_nsevent,ns,*PC_TAGS)
+			run('timediff_py',pyns.timediff_py,py_event)
+			run('timediff_ns',pyns.timediff_ns,ns_event)
+			match=run('match_tables',match_tables,py_event,ns_event)
+			run('fit_clock',fit_clock,py_event.onset[match.py],ns_event.onset[match.ns])
+			run('photocell_py',pyns.photocell_py,py,'wsq',*PC_TAGS)
+			run('photocell_ns',pyns.photocell_ns,ns,*PC_TAGS)
+			report[str(size)]=stages
+	finally:
+		shutil.rmtree(folder,ignore_errors=True)
+	return report
+
+
+def compare(report,baseline):
+	"""Prints every stage of report next to the baseline; returns the list of (size, stage, ratio) regressions."""
+	regressions=[]
+	print('%8s | %-15s | %10s | %10s | %6s | %8s' % ('size','stage','ms','base ms','ratio','peak MB'))
+	for size,stages in sorted(report.items(),key=lambda item: int(item[0])):
+		for stage,result in stages.items():
+			base=baseline.get(size,{}).get(stage)
+			ratio=result['ms']/base['ms'] if base and base['ms'] and not result['error'] else None
+			flag=' <-- slower' if ratio and ratio > REGRESSION_RATIO else ''
+			print('%8s | %-15s | %10s | %10s | %6s | %8.2f%s' % (size,stage,result['error'] and 'error' or result['ms'],
+				base['ms'] if base else '-',round(ratio,2) if ratio else '-',result['mb'],flag))
+			if flag:
+				regressions.append((size,stage,ratio))
+	return regressions
+
+
+def synth_events(n_events,drift_ppm,dropped=0.0,extra=0.0,isi=1500.0,jitter=2.0,seed=0):
+	"""
+	Example: synth_events(4800, 50, dropped=0.02)
+
+	(py codes, py onsets, ns codes, ns onsets, py index of every ns row or -1) of a synthetic session: NS onsets
+	on an amp clock starting 200 ms early and drift_ppm fast, a share of NS events dropped and extra 'syn' rows added.
+	"""
+	rng=np.random.RandomState(seed)
+	py_code=np.array(PC_TAGS)[rng.randint(0,len(PC_TAGS),n_events)]
+	py_onset=1000.0+np.cumsum(rng.uniform(0.5*isi,1.5*isi,n_events))
+	ns_onset=np.round(200.0+(py_onset-py_onset[0])*(1+drift_ppm*1e-6)+rng.normal(0,jitter,n_events))
+	kept=np.flatnonzero(rng.rand(n_events) >= dropped)
+	n_extra=int(extra*n_events)
+	ns_code=np.concatenate([py_code[kept],np.array(['syn']*n_extra,dtype=py_code.dtype)])
+	ns_onset=np.concatenate([ns_onset[kept],rng.uniform(ns_onset[0],ns_onset[-1],n_extra).round()])
+	truth=np.concatenate([kept,np.full(n_extra,-1)])
+	order=np.argsort(ns_onset,kind='mergesort')
+	return py_code,py_onset,ns_code[order],ns_onset[order],truth[order]
+
+
+def bench_match(cases=MATCH_CASES):
+	"""
+	Example: bench_match([(4800, 100, 0.02, 0.02)])
+
+	match_events on synth_events for every case. Returns a list of (case, NS events to match, correct pairs,
+	wrong pairs, ms).
+	"""
+	results=[]
+	for case in cases:
+		py_code,py_onset,ns_code,ns_onset,truth=synth_events(*case)
+		start=time.perf_counter()
+		match=match_events(py_code,py_onset,ns_code,ns_onset)
+		ms=(time.perf_counter()-start)*1000
+		correct=int(np.count_nonzero(truth[match.ns] == match.py))
+		results.append((case,int(np.count_nonzero(truth >= 0)),correct,len(match.py)-correct,round(ms,1)))
+	return results
+
+
+def bench_startup(repeat=7):
+	"""Best of repeat wall times (ms) of each STARTUP_COMMANDS entry in a fresh interpreter, run from this folder."""
+	here=os.path.dirname(os.path.abspath(__file__))
+	times={}
+	for name,args in STARTUP_COMMANDS:
+		best=None
+		for i in range(repeat):
+			start=time.time()
+			subprocess.check_call([sys.executable]+args,cwd=here,stdout=subprocess.DEVNULL)
+			ms=(time.time()-start)*1000
+			best=ms if best is None else min(best,ms)
+		times[name]=round(best,1)
+	return times
+
+
+if __name__ == '__main__':
+	if len(sys.argv) > 1 and sys.argv[1] == 'startup':
+		times=bench_startup()
+		for name,args in STARTUP_COMMANDS:
+			print('%-16s | %8.1f ms' % (name,times[name]))
+		cli=times['pyns --help']-times['interpreter']
+		print('pyns --help costs %.1f ms over a bare interpreter (target %d ms)' % (cli,STARTUP_TARGET_MS))
+		sys.exit(1 if cli > STARTUP_TARGET_MS else 0)
+	if len(sys.argv) > 1 and sys.argv[1] == 'match':
+		print('  events |  ppm | dropped | extra | to match | correct | wrong |       ms')
+		failed=False
+		for (n_events,ppm,dropped,extra),expected,correct,wrong,ms in bench_match():
+			print('%8d | %4d | %7.2f | %5.2f | %8d | %7d | %5d | %8.1f' % (n_events,ppm,dropped,extra,expected,correct,wrong,ms))
+			failed=failed or correct < expected or wrong > 0
+		sys.exit(1 if failed else 0)
+	if len(sys.argv) > 1 and sys.argv[1] == 'pipeline':
+		args=sys.argv[2:]
+		options=dict((args[i],args[i+1]) for i in range(len(args)-1) if args[i].startswith('--'))
+		sizes=[int(arg) for arg in args if arg.isdigit()] or [1000,10000,100000]
+		report=bench_pipeline(sizes)
+		baseline={}
+		if '--compare' in options:
+			with open(options['--compare']) as baseFile:
+				baseline=json.load(baseFile)
+		regressions=compare(report,baseline)
+		if '--save' in options:
+			with open(options['--save'],'w') as baseFile:
+				json.dump(report,baseFile,indent=1,sort_keys=True)
+		sys.exit(1 if regressions else 0)
+	print('filter_event on 100000 events: tags | rows | ms | ns/row')
+	for count,rows,ms in bench_filter():
+		print('%4d | %6d | %8.3f | %6.1f' % (count,rows,ms,ms*1e6/max(rows,1)))
@@ -0,0 +1,135 @@
+"""
+On-disk cache of parsed logs, used by pyns_core.filter_pylog/filter_nslog(..., cache=True).
+
+Each parsed EventTable is stored as a binary .npz sidecar in a shared cache directory
+(PYNS_CACHE_DIR environment variable, default ~/.cache/pyns), named after the log's
+absolute path and the kind of parse (ie. 'pylog-data', 'nslog').
+Every entry remembers the fingerprint of the log it was parsed from: size, mtime and a sha1 of the content.
+	- size and mtime unchanged: the entry is loaded straight away (no hashing)
+	- size or mtime changed: the log is hashed, and reparsed if the content changed
+After writing an entry the oldest entries are evicted until the directory is below MAX_CACHE_BYTES.
+
+Example: table = cached_table('example_pylog.log', 'pylog-data', lambda: filter_pylog('example_pylog','data'))
+"""
+import os
+import hashlib
+import tempfile
+import numpy as np
+from pyns_core import EventTable
+from pyns_profile import stage
+
+CACHE_DIR=os.environ.get('PYNS_CACHE_DIR',os.path.join(os.path.expanduser('~'),'.cache','pyns'))
+MAX_CACHE_BYTES=256*1024*1024
+#bump when the stored layout of EventTable changes
+CACHE_VERSION=1
+
+
+def content_hash(path):
+	"""sha1 hex digest of the file content, read in 1MB blocks."""
+	digest=hashlib.sha1()
+	with open(path,'rb') as logFile:
+		for block in iter(lambda: logFile.read(1 << 20),b''):
+			digest.update(block)
+	return digest.hexdigest()
+
+
+def cache_path(path,kind,cache_dir=None):
+	"""Location of the cache entry of (log path, kind) inside cache_dir."""
+	key=(os.path.abspath(path) + '|' + kind).encode('utf-8')
+	return os.path.join(cache_dir or CACHE_DIR,hashlib.sha1(key).hexdigest()[:24] + '.npz')
+
+
+def save_table(table,entry,size,mtime,digest):
+	"""Writes table and the log fingerprint to entry (atomically, via a temp file + rename)."""
+	folder=os.path.dirname(entry)
+	if not os.path.isdir(folder):
+		os.makedirs(folder)
+	handle,temp=tempfile.mkstemp(suffix='.npz',dir=folder)
+	try:
+		with os.fdopen(handle,'wb') as out:
+			np.savez(out,version=CACHE_VERSION,size=size,mtime=mtime,digest=np.array(digest),
+				onset=table.onset,duration=table.duration,source=table.source,
+				tag_code=table.tag_code,tags=np.array(table.tags,dtype='U'),
+				prefix_code=table.prefix_code,prefixes=np.array(table.prefixes,dtype='U'))
+		getattr(os,'replace',os.rename)(temp,entry)
+	except Exception:
+		os.remove(temp)
+		raise
+
+
+def load_entry(entry):
+	"""Returns (fingerprint dict, EventTable) of a cache entry, or (None, None) if missing/unreadable/outdated."""
+	try:
+		with np.load(entry,allow_pickle=False) as data:
+			if int(data['version']) != CACHE_VERSION:
+				return None,None
+			meta={'size':int(data['size']),'mtime':float(data['mtime']),'digest':str(data['digest'])}
+			table=EventTable(data['onset'],data['duration'],data['source'],data['tag_code'],
+				data['tags'].tolist(),data['prefix_code'],data['prefixes'].tolist())
+		return meta,table
+	except (IOError,OSError,KeyError,ValueError):
+		return None,None
+
+
+@stage('cached_table',source=lambda args,kwargs: args[0])
+def cached_table(path,kind,parse,cache_dir=None,max_bytes=None):
+	"""
+	Syntax: cached_table(log path, kind of parse, function returning the parsed EventTable)
+	Example: cached_table('test1', 'nslog', lambda: filter_nslog('test1'))
+
+	Returns the EventTable of path from the cache if the log did not change, otherwise calls parse()
+	and stores its result.
+	"""
+	stat=os.stat(path)
+	entry=cache_path(path,kind,cache_dir)
+	meta,table=load_entry(entry)
+	if meta is not None and meta['size'] == stat.st_size:
+		if meta['mtime'] == stat.st_mtime:
+			#mark as recently used for evict (another process may have evicted it meanwhile)
+			try:
+				os.utime(entry,None)
+			except OSError:
+				pass
+			return table
+		digest=content_hash(path)
+		if meta['digest'] == digest:
+			#touched but unchanged: refresh the stored mtime
+			save_table(table,entry,stat.st_size,stat.st_mtime,digest)
+			return table
+	else:
+		digest=content_hash(path)
+	table=parse()
+	save_table(table,entry,stat.st_size,stat.st_mtime,digest)
+	evict(os.path.dirname(entry),MAX_CACHE_BYTES if max_bytes is None else max_bytes)
+	return table
+
+
+def evict(cache_dir,max_bytes):
+	"""
+	Removes least recently used .npz entries of cache_dir until it holds at most max_bytes.
+	Several processes (ie. pyns_batch workers) may evict at once: entries that vanish meanwhile are skipped.
+	"""
+	if not os.path.isdir(cache_dir):
+		return
+	entries=[]
+	for name in os.listdir(cache_dir):
+		if name.endswith('.npz'):
+			try:
+				stat=os.stat(os.path.join(cache_dir,name))
+			except OSError:
+				continue
+			entries.append((stat.st_mtime,stat.st_size,os.path.join(cache_dir,name)))
+	total=sum(size for mtime,size,entry in entries)
+	for mtime,size,entry in sorted(entries):
+		if total <= max_bytes:
+			break
+		try:
+			os.remove(entry)
+		except OSError:
+			pass
+		total-=size
+
+
+def clear(cache_dir=None):
+	"""Removes every entry of the cache directory."""
+	evict(cache_dir or CACHE_DIR,0)
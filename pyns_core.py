@@ -6,6 +6,9 @@ Processing log info is segmented into 3 phases to add flexibility:
 	- timediff: computes time difference
 
 There are 3 functions for each, PsychoPy and NetStation.
+Both filter_log functions return an EventTable (columnar onset/duration/source arrays with integer coded tags),
+so the later phases run as array operations.
+Every phase is a pyns_profile stage: enable pyns_profile to record time, rows and bytes read per phase.
 
 Order of processing:
 1. PsychoPy:   filter_pylog --> filter_pyevent --> timediff_py
@@ -20,50 +23,255 @@ The second part measures and prints out timing difference for photocell timing i
 Type help(function name) for function docstring. ie. help(filter_pylog)
 """
 from __future__ import division
-import csv
-import time
-import pandas as pd
+import mmap
+import os
+import re
+from collections import namedtuple
 import numpy as np
-from decimal import Decimal
+from pyns_profile import stage
+
+
+### Event Table ###
+SOURCE_PY=0
+SOURCE_NS=1
+
+
+class EventTable(object):
+	"""
+	Compact columnar event table shared by PsychoPy and NetStation logs.
+
+	Columns (one entry per event, kept in onset order):
+	onset:       float64 array of milliseconds
+	duration:    float64 array of milliseconds (0 for PsychoPy events)
+	source:      int8 array, SOURCE_PY or SOURCE_NS
+	tag_code:    int32 array indexing into tags (event code, ie. 'sbli', 'DIN3', 'wsqS')
+	prefix_code: int32 array indexing into prefixes (first three letters used by filter_*event)
+
+	tags/prefixes are the categorical lookup lists, shared between a table and its subsets.
+	"""
+	__slots__=('onset','duration','source','tag_code','tags','prefix_code','prefixes','_prefix_index')
+
+	def __init__(self,onset,duration,source,tag_code,tags,prefix_code,prefixes):
+		self.onset=onset
+		self.duration=duration
+		self.source=source
+		self.tag_code=tag_code
+		self.tags=tags
+		self.prefix_code=prefix_code
+		self.prefixes=prefixes
+		self._prefix_index=None
+
+	@classmethod
+	def from_events(cls,onset,labels,source,duration=None):
+		"""
+		Example: EventTable.from_events([11835.1, 18549.9], ['intS', 'sbli'], SOURCE_PY)
+
+		Builds a table from parallel onset/label sequences, encoding labels as categorical codes.
+		Rows are stably sorted by onset.
+		"""
+		onset=np.asarray(onset,dtype=np.float64)
+		if duration is None:
+			duration=np.zeros(len(onset),dtype=np.float64)
+		else:
+			duration=np.asarray(duration,dtype=np.float64)
+		source=np.full(len(onset),source,dtype=np.int8)
+		if len(onset) == 0:
+			empty=np.zeros(0,dtype=np.int32)
+			return cls(onset,duration,source,empty,[],empty.copy(),[])
+		tags,tag_code=np.unique(np.asarray(labels),return_inverse=True)
+		prefixes,prefix_code=np.unique(np.array([tag[0:3] for tag in tags]),return_inverse=True)
+		table=cls(onset,duration,source,tag_code.astype(np.int32),tags.tolist(),
+			prefix_code[tag_code].astype(np.int32),prefixes.tolist())
+		if (np.diff(onset) < 0).any():
+			table=table.take(np.argsort(onset,kind='mergesort'))
+		return table
+
+	def __len__(self):
+		return len(self.onset)
+
+	def take(self,index):
+		"""
+		Example: table.take(np.array([0, 2, 5]))
+
+		Returns the subset of rows at index (integer array or boolean mask), sharing the category lists.
+		"""
+		return EventTable(self.onset[index],self.duration[index],self.source[index],
+			self.tag_code[index],self.tags,self.prefix_code[index],self.prefixes)
+
+	@staticmethod
+	def code_of(categories,*names):
+		"""Integer codes of the given category names (unknown names are skipped)."""
+		return np.array([categories.index(name) for name in names if name in categories],dtype=np.int32)
+
+	def prefix_mask(self,*event_tags):
+		"""Boolean mask of rows whose three letter prefix is one of event_tags."""
+		wanted=np.zeros(len(self.prefixes)+1,dtype=bool)
+		wanted[self.code_of(self.prefixes,*[str(event) for event in event_tags])]=True
+		return wanted[self.prefix_code]
+
+	def prefix_index(self):
+		"""
+		Example: table.prefix_index()['sbl'] --> array([4, 6, 8, ...])
+
+		Hash map of three letter prefix --> sorted row indices of that prefix.
+		Built once per table with a single stable argsort over prefix_code, then reused by select.
+		"""
+		if self._prefix_index is None:
+			order=np.argsort(self.prefix_code,kind='mergesort')
+			bounds=np.cumsum(np.bincount(self.prefix_code,minlength=len(self.prefixes)))
+			self._prefix_index=dict(zip(self.prefixes,np.split(order,bounds[:-1])))
+		return self._prefix_index
+
+	def select(self,*event_tags):
+		"""
+		Example: table.select('int','ope','clo')
+
+		Row indices (in onset order) of rows whose three letter prefix is one of event_tags.
+		Each tag is a hash lookup in prefix_index. A single tag returns its index list as is. Several tags
+		merge their sorted index lists, O(M log k) for M selected rows, while M log k stays under N / 2;
+		past that point one O(N) pass over prefix_mask is cheaper, so a call never costs much more than
+		one scan of the table whatever the number of tags.
+		"""
+		index=self.prefix_index()
+		runs=[index[event] for event in set(str(event) for event in event_tags) if event in index]
+		if not runs:
+			return np.zeros(0,dtype=np.intp)
+		if len(runs) == 1:
+			return runs[0]
+		if sum(len(run) for run in runs)*np.log2(len(runs)) >= len(self)/2:
+			return np.flatnonzero(self.prefix_mask(*event_tags))
+		#mergesort detects the pre-sorted runs and merges them
+		return np.sort(np.concatenate(runs),kind='mergesort')
+
+	def tag_mask(self,*tags):
+		"""Boolean mask of rows whose full tag is one of tags."""
+		wanted=np.zeros(len(self.tags)+1,dtype=bool)
+		wanted[self.code_of(self.tags,*[str(tag) for tag in tags])]=True
+		return wanted[self.tag_code]
+
+	def labels(self):
+		"""Tag string of each row."""
+		return [self.tags[code] for code in self.tag_code]
+
+	def rows(self):
+		"""List-of-lists view [[onset, tag], ...] for printing or legacy code."""
+		return [list(row) for row in zip(self.onset.tolist(),self.labels())]
 
 
 ### Processing PsychoPy ###
-def filter_pylog(filename,columnName):
+def read_pylog(filename,level='data'):
 	"""
-	Syntax: filter_pylog('string of csv file name w/o extension','data')
-	Example: filter_pylog('test2','data')
+	Syntax: read_pylog('string of log file name with extension','data')
+	Example: for ms, level, message in read_pylog('test2.log','data'): ...
 
-	This function is specific for PsychoPy log csv. It calls in the converted csv fileself.
-	First cleans data with random '' and data types.
-	Then filters out specific column data types.
-	"""
-	filtered_pylog=[]
-	columnName=columnName.lower()
-	csv_name=str(filename) + ".csv"
-	with open(csv_name) as csvDataFile:
-		pydata=list(csv.reader(csvDataFile))
-	#clean out empty ' ' in data
-	for i in range(0,len(pydata)):
-		try:
-			pydata[i][1]=pydata[i][1][:-1].lower()
-		except IndexError:
-			pass
-	#convert from 'string of seconds' to 'float of milliseconds'
-	for i in range(0,len(pydata)):
-		try:
-			pydata[i][0]=round(float(pydata[i][0])*1000,2)
-		except ValueError:
-			pass
-	#filter out data by columnName
-	for i in range(0,len(pydata)):
+	Generator that streams the raw PsychoPy log line by line.
+	The level column is checked before the rest of the line is split or decoded,
+	so the (many) EXP/DEBUG lines are dropped with a single byte comparison.
+	Yields typed (milliseconds, level, message) tuples of the matching level only.
+	"""
+	level=str(level).lower()
+	level_tag=level.upper().encode('ascii')
+	with open(str(filename),'rb') as logFile:
+		for line in logFile:
+			row=parse_pyline(line,level_tag)
+			if row is not None:
+				yield row[0],level,row[1]
+
+
+def parse_pyline(line,level_tag=b'DATA'):
+	"""
+	Example: parse_pyline(b'18.5499 \tDATA \tsbli | frame count: 120\n') --> (18549.9, u'sbli | frame count: 120')
+
+	Parses one raw (bytes) PsychoPy log line into (milliseconds, message) if its level is level_tag, else None.
+	The level is checked before the rest of the line is split or decoded.
+	"""
+	stamp,sep,rest=line.partition(b'\t')
+	if not rest.startswith(level_tag):
+		return None
+	#'DATA \t' -- make sure it is the whole level, not a longer one (ie. DATAX)
+	if rest[len(level_tag):len(level_tag)+1] not in (b' ',b'\t'):
+		return None
+	message=rest.partition(b'\t')[2].rstrip(b'\r\n')
+	try:
+		return round(float(stamp)*1000,2),message.decode('utf-8','replace')
+	except ValueError:
+		return None
+
+
+#start of a PsychoPy log record: '<seconds> \t<LEVEL> \t'
+PYLOG_RECORD=re.compile(br'(\d+(?:\.\d+)?) ?\t([A-Z]+) ?\t')
+
+
+def scan_pylog(filename,level='data'):
+	"""
+	Syntax: scan_pylog('string of log file name with extension','data')
+	Example: for ms, level, message in scan_pylog('test2.log','data'): ...
+
+	Memory-mapped version of read_pylog for very large logs.
+	A compiled bytes regex jumps straight to the '\t<LEVEL> \t' column of matching records;
+	each hit is checked to sit at a '^<seconds> \t<LEVEL> \t' record start, and the message runs
+	up to the next record start, so multi-line entries (ie. 'vertices = array(...)' dumps) stay whole.
+	Only matching records are decoded; the rest of the file is never turned into Python strings.
+	Yields typed (milliseconds, level, message) tuples.
+	"""
+	level=str(level).lower()
+	target=re.compile(br'\t' + re.escape(level.upper().encode('ascii')) + br' ?\t')
+	with open(str(filename),'rb') as logFile:
+		if os.fstat(logFile.fileno()).st_size == 0:
+			return
+		data=mmap.mmap(logFile.fileno(),0,access=mmap.ACCESS_READ)
 		try:
-			if pydata[i][1]==str(columnName):
-				filtered_pylog.append(pydata[i])
-		except IndexError:
-			pass
-	return filtered_pylog
+			for hit in target.finditer(data):
+				start=data.rfind(b'\n',0,hit.start())+1
+				record=PYLOG_RECORD.match(data,start)
+				if record is None or record.end() != hit.end():
+					continue
+				#message continues over lines that do not start a new record
+				end=data.find(b'\n',hit.end())
+				while end != -1 and PYLOG_RECORD.match(data,end+1) is None and end+1 < len(data):
+					end=data.find(b'\n',end+1)
+				if end == -1:
+					end=len(data)
+				message=data[hit.end():end].rstrip(b'\r\n')
+				yield round(float(record.group(1))*1000,2),level,message.decode('utf-8','replace')
+		finally:
+			data.close()
+
+
+@stage('filter_pylog',source=lambda args,kwargs: str(args[0]) + '.log')
+def filter_pylog(filename,columnName,cache=False):
+	"""
+	Syntax: filter_pylog('string of log file name w/o extension','data',cache=False)
+	Example: filter_pylog('test2','data')
+
+	This function is specific for PsychoPy log. It scans the raw .log file through scan_pylog (memory-mapped),
+	so no intermediate csv is written and only rows of the given column data type are decoded.
+	Returns an EventTable; the tag of each event is its message up to ' | ' (ie. 'sbli | frame count: 120' --> 'sbli').
+	cache=True reuses the parsed table stored by pyns_cache as long as the log file is unchanged.
+	"""
+	if cache:
+		import pyns_cache
+		return pyns_cache.cached_table(str(filename) + ".log",'pylog-' + str(columnName).lower(),
+			lambda: filter_pylog(filename,columnName))
+	onset,labels=[],[]
+	for ms,level,message in scan_pylog(str(filename) + ".log",columnName):
+		onset.append(ms)
+		labels.append(message.split(' | ')[0])
+	return EventTable.from_events(onset,labels,SOURCE_PY)
+
+
+def filter_event(table,*event_tags):
+	"""
+	Syntax: filter_event(EventTable from filter_pylog/filter_nslog,'event_tags1','event_tags2'...)
+	Example: filter_event(table,'int','ope','clo')
+
+	Shared implementation of filter_pyevent/filter_nsevent: keeps rows whose first three letters
+	match one of event_tags, in onset order. Uses the table's cached prefix index (see EventTable.select).
+	"""
+	return table.take(table.select(*event_tags))
 
 
+@stage('filter_pyevent')
 def filter_pyevent(filtered_pydata,*event_tags):
 	"""
 	Syntax: filter_pyevent(cleaned data from previous function filter_pylog,'event_tags1','event_tags2'...)
@@ -73,63 +281,119 @@ def filter_pyevent(filtered_pydata,*event_tags):
 	and takes variable arguments with user specific event tags.
 	Note that it reads the first three letters of the event tags as NetStation communication is limiting with 4 letters.
 	"""
-	filtered_pyevent=[]
-	for event in event_tags:
-		for i in range(0,len(filtered_pydata)):
-			if filtered_pydata[i][2][0:3]==str(event):
-				filtered_pyevent.append(filtered_pydata[i])
-	filtered_pyevent=sorted(filtered_pyevent)
-	return filtered_pyevent
+	return filter_event(filtered_pydata,*event_tags)
 
 
+@stage('timediff_py')
 def timediff_py(filtered_pyevent):
 	"""
 	Example: timediff_py(filtered_pyevent)
 
-	This function takes in the sorted event list, and takes difference of every each item.
+	This function takes in the sorted event table, and takes difference of every each item.
 	Resulted time difference is in milliseconds.
 	ie. item[1]-item[0], item[2]-item[1] ...
 	"""
-	diff_py=[]
-	for i in range(0,len(filtered_pyevent)-1):
-		k = round(filtered_pyevent[i+1][0]-filtered_pyevent[i][0],1)
-		diff_py.append(k)
-	return diff_py
+	return np.round(np.diff(filtered_pyevent.onset),1)
 
 
 ### Processing NetStation ###
-def filter_nslog(filename):
+#NetStation onset/duration format: '_HH:MM:SS.mmm'
+NS_TIME_WIDTH=13
+NsColumns=namedtuple('NsColumns',['code','label','kind','track','onset','duration'])
+
+
+def decode_nstime(column):
+	"""
+	Syntax: decode_nstime(sequence of '_HH:MM:SS.mmm' strings)
+	Example: decode_nstime([b'_00:00:07.284',b'']) --> (array([7284, 0]), array([ True, False]))
+
+	Decodes the whole NetStation time column at once into an int64 millisecond array.
+	The strings are viewed as a fixed-width (N, 13) byte matrix, so no per-row int() slicing is done.
+	Returns (ms, valid): entries not in the '_HH:MM:SS.mmm' format are False in valid and 0 in ms.
+	"""
+	raw=np.asarray(column,dtype='S%d' % NS_TIME_WIDTH)
+	if raw.size == 0:
+		return np.zeros(0,dtype=np.int64),np.zeros(0,dtype=bool)
+	digits=raw.view(np.uint8).reshape(-1,NS_TIME_WIDTH).astype(np.int64)-ord('0')
+	body=digits[:,[1,2,4,5,7,8,10,11,12]]
+	seps=digits[:,[3,6,9]]+ord('0')
+	valid=((body >= 0) & (body <= 9)).all(axis=1) & (seps == [ord(':'),ord(':'),ord('.')]).all(axis=1)
+	body=np.where(valid[:,None],body,0)
+	hh=body[:,0]*10+body[:,1]
+	mm=body[:,2]*10+body[:,3]
+	ss=body[:,4]*10+body[:,5]
+	ms=body[:,6]*100+body[:,7]*10+body[:,8]
+	return ((hh*60+mm)*60+ss)*1000+ms,valid
+
+
+def parse_nstime(column):
+	"""
+	Syntax: parse_nstime(sequence of '_HH:MM:SS.mmm' strings)
+	Example: parse_nstime(['_00:00:07.284','_00:00:00.001']) --> array([7284, 1])
+
+	decode_nstime of a column that must be well formed.
+	Raises ValueError if any entry is not in the '_HH:MM:SS.mmm' format.
 	"""
-	Syntax: filter_nslog('string of csv file name w/o extension')
+	ms,valid=decode_nstime(column)
+	if not valid.all():
+		raise ValueError("NetStation time not in '_HH:MM:SS.mmm' format")
+	return ms
+
+
+@stage('read_nslog',source=lambda args,kwargs: str(args[0]))
+def read_nslog(filename):
+	"""
+	Syntax: read_nslog('string of NetStation event export file name')
+	Example: ns=read_nslog('test1'); ns.onset, ns.code
+
+	Reads the tab-delimited NetStation event export directly (no csv conversion).
+	Header lines are skipped, then the Onset and Duration columns are decoded with decode_nstime.
+	Rows whose onset is not a NetStation time are dropped; a malformed Duration cell reads as 0 ms,
+	so one bad cell does not abort the whole export.
+	Returns NsColumns(code, label, kind, track, onset, duration):
+	code/label/kind/track are lists of strings, onset/duration are int64 millisecond arrays.
+	"""
+	code,label,kind,track,onset,duration=[],[],[],[],[],[]
+	with open(str(filename),'rb') as nsFile:
+		for line in nsFile:
+			fields=line.rstrip(b'\r\n').split(b'\t')
+			#data rows carry an onset as 5th column: '_HH:MM:SS.mmm'
+			if len(fields) < 6 or len(fields[4]) != NS_TIME_WIDTH:
+				continue
+			code.append(fields[0].decode('utf-8','replace'))
+			label.append(fields[1].decode('utf-8','replace'))
+			kind.append(fields[2].decode('utf-8','replace'))
+			track.append(fields[3].decode('utf-8','replace'))
+			onset.append(fields[4])
+			duration.append(fields[5])
+	onset,good=decode_nstime(onset)
+	duration=decode_nstime(duration)[0]
+	if not good.all():
+		keep=np.flatnonzero(good).tolist()
+		code,label,kind,track=[[column[i] for i in keep] for column in (code,label,kind,track)]
+		onset,duration=onset[good],duration[good]
+	return NsColumns(code,label,kind,track,onset,duration)
+
+
+@stage('filter_nslog')
+def filter_nslog(filename,cache=False):
+	"""
+	Syntax: filter_nslog('string of NetStation event export file name',cache=False)
 	Example: filter_nslog('test1')
 
-	This function is specific for NetStation log csv. It calls in the converted csv.
-	First cleans data with random '_' and converts HH:MM:SS:MS time format to milliseconds.
+	This function is specific for NetStation event export. It reads the export through read_nslog,
+	so HH:MM:SS.MMM onsets are already converted to milliseconds.
+	Returns an EventTable tagged by the event Code column.
+	cache=True reuses the parsed table stored by pyns_cache as long as the export file is unchanged.
 	"""
-	csv_name=str(filename) + ".csv"
-	with open(csv_name) as csvDataFile:
-		nsdata=list(csv.reader(csvDataFile))
-	#remove random '_' in front of time format
-	for i in range(0,len(nsdata)):
-		try:
-			nsdata[i][4]=nsdata[i][4][1:]
-		except IndexError:
-			pass
-	#convert from string of HH:MM:SS:MMM to MS
-	for i in range(0,len(nsdata)):
-		try:
-			hh=int(nsdata[i][4][0:2]) * 3600000
-			mm=int(nsdata[i][4][3:5]) * 60000
-			ss=int(nsdata[i][4][6:8]) * 1000
-			ms=int(nsdata[i][4][9:12])
-			nsdata[i][4]=hh+mm+ss+ms
-		except IndexError:
-			pass
-		except ValueError:
-			pass
-	return nsdata
+	if cache:
+		import pyns_cache
+		return pyns_cache.cached_table(str(filename),'nslog',lambda: filter_nslog(filename))
+	ns=read_nslog(filename)
+	return EventTable.from_events(ns.onset,ns.code,SOURCE_NS,ns.duration)
 
 
+@stage('filter_nsevent')
 def filter_nsevent(filtered_nslog,*event_tags):
 	"""
 	Syntax: filter_nsevent(cleaned data from previous function filter_nslog,'event_tags1','event_tags2'...)
@@ -139,30 +403,22 @@ def filter_nsevent(filtered_nslog,*event_tags):
 	and takes variable arguments with user specific event tags.
 	Note that it reads the first three letters of the event tags as NetStation communication is limiting with 4 letters.
 	"""
-	filtered_nsevent=[]
-	for event in event_tags:
-		for i in range(0,len(filtered_nslog)):
-			if filtered_nslog[i][0][0:3]==str(event):
-				filtered_nsevent.append(filtered_nslog[i])
-	# filtered_nsevent=filtered_nsevent.sort(key=lambda x: x[4])
-	filtered_nsevent=sorted(filtered_nsevent, key=lambda x: int(x[4]))
-	return filtered_nsevent
+	return filter_event(filtered_nslog,*event_tags)
 
 
+@stage('timediff_ns')
 def timediff_ns(filtered_nsevent):
 	"""
 	Example: timediff_py(filtered_nsevent)
 
-	This function takes in the sorted event list, and takes difference of every each item.
+	This function takes in the sorted event table, and takes difference of every each item.
 	Resulted time difference is in milliseconds.
 	ie. item[1]-item[0], item[2]-item[1] ...
 	"""
-	diff_ns=[]
-	for i in range(0,len(filtered_nsevent)-1):
-		diff_ns.append(filtered_nsevent[i+1][4]-filtered_nsevent[i][4])
-	return diff_ns
+	return np.diff(filtered_nsevent.onset)
 
 
+@stage('average_diff')
 def average_diff(diff_py,diff_ns):
 	"""
 	Example: average_diff(diff_py,diff_ns)
@@ -175,87 +431,102 @@ def average_diff(diff_py,diff_ns):
 		print("Length of Py log and Ns log different. Make sure event tags match.")
 		return
 	else:
-		diff=list(np.array(diff_py)-np.array(diff_ns))
-		for i in range(0,len(diff)):
-			diff[i]=round(diff[i],2)
-			diff[i]=abs(diff[i])
-			#give simple text warning if difference exceeds over 15ms
-			if diff[i] >= 15:
-				print("WARNING: big diff at PY-NS timing: index# " + str(i) + ": " + str(diff[i]) + " (above 15ms)")
-			avg=round(sum(diff)/len(diff),2)
-			return avg
+		diff=np.abs(np.round(np.asarray(diff_py,dtype=np.float64)-np.asarray(diff_ns,dtype=np.float64),2))
+		#give simple text warning if difference exceeds over 15ms
+		for i in np.flatnonzero(diff >= 15):
+			print("WARNING: big diff at PY-NS timing: index# " + str(i) + ": " + str(diff[i]) + " (above 15ms)")
+		if len(diff) != 0:
+			return round(float(diff.mean()),2)
+
+
+### Photocell Pairing ###
+#photocell hits later than this after a trigger are not paired with it (ms)
+MAX_PC_LAG=1000
+PcPairs=namedtuple('PcPairs',['latency','trigger','photocell','unmatched_trigger','unmatched_photocell'])
+
+
+@stage('pair_photocell')
+def pair_photocell(trigger_onset,pc_onset,max_lag=MAX_PC_LAG):
+	"""
+	Syntax: pair_photocell(sorted trigger onsets, sorted photocell onsets, max lag in ms)
+	Example: pair_photocell(table.onset[table.prefix_mask('sbl')], table.onset[table.tag_mask('DIN3')])
+
+	Pairs every photocell hit with the closest trigger at or before it (np.searchsorted),
+	if it lies within max_lag ms. Each trigger is paired with its first photocell hit only.
+	Returns PcPairs(latency, trigger, photocell, unmatched_trigger, unmatched_photocell),
+	where trigger/photocell are index arrays into the inputs of each pair and the unmatched_*
+	arrays index the triggers without a photocell hit and the photocell hits without a trigger.
+	"""
+	trigger_onset=np.asarray(trigger_onset,dtype=np.float64)
+	pc_onset=np.asarray(pc_onset,dtype=np.float64)
+	trigger=np.searchsorted(trigger_onset,pc_onset,side='right')-1
+	lag=pc_onset-trigger_onset[np.maximum(trigger,0)] if len(trigger_onset) else pc_onset
+	valid=np.flatnonzero((trigger >= 0) & (lag <= max_lag))
+	#keep the first photocell hit of each trigger
+	trigger,first=np.unique(trigger[valid],return_index=True)
+	photocell=valid[first]
+	return PcPairs(lag[photocell],trigger,photocell,
+		np.setdiff1d(np.arange(len(trigger_onset)),trigger),
+		np.setdiff1d(np.arange(len(pc_onset)),photocell))
+
+
+def warn_big_diff(diffs,name):
+	"""Prints a simple text warning for every difference of 15ms or more."""
+	for i in np.flatnonzero(np.asarray(diffs) >= 15):
+		print("WARNING: big diff at " + name + " index# " + str(i) + ": " + str(diffs[i]) + " (above 15ms)")
+
+
+def warn_unmatched(pairs,name):
+	"""Prints how many triggers/photocell hits could not be paired."""
+	if len(pairs.unmatched_trigger) or len(pairs.unmatched_photocell):
+		print("WARNING: " + name + " unmatched triggers: " + str(len(pairs.unmatched_trigger)) +
+			", unmatched photocell hits: " + str(len(pairs.unmatched_photocell)))
 
 
 ### PsychoPy Photocell Timing ###
-def photocell_py(filename, pc_tag, *event_tags):
+@stage('photocell_py')
+def photocell_py(filename, pc_tag, *event_tags, **kwargs):
 	"""
-	Syntax: photocell_py(string of filename w/o extension, 'photocell tag labeled as in Py log', 'custom event tags')
+	Syntax: photocell_py(string of filename w/o extension, 'photocell tag labeled as in Py log', 'custom event tags', max_lag=ms, cache=False)
 	Example: photocell_py('test2','wsq','ope','clo','gaz')
 
-	This function takes in csv filename of PsychoPy log, and measures time difference of each
-	photocell tag - previous event tag = photocell time delay
-	"""
-	filtered_pylog=filter_pylog(str(filename),'data')
-	filtered_pc,diff_pypc=[],[]
-	#filter pc_tag to list
-	for i in range(0,len(filtered_pylog)):
-		if filtered_pylog[i][2][0:3]==str(pc_tag):
-			filtered_pc.append(filtered_pylog[i])
-	#filter custom event_tags to list
-	for event in event_tags:
-		for i in range(0,len(filtered_pylog)):
-			if filtered_pylog[i][2][0:3]==str(event):
-				filtered_pc.append(filtered_pylog[i])
-	filtered_pc=sorted(filtered_pc)
-	#calculate photocell timing difference
-	for i in range(0,len(filtered_pc)):
-		if filtered_pc[i][2][0:3]==str(pc_tag):
-			diff_pypc.append(round(float(filtered_pc[i][0])-float(filtered_pc[i-1][0]),3))
-
+	This function takes in filename of PsychoPy log (or its EventTable from filter_pylog), and measures time difference of each
+	photocell tag - paired event tag = photocell time delay (see pair_photocell).
+	max_lag (default MAX_PC_LAG) is the longest delay still paired with an event tag.
+	cache=True reads the log through pyns_cache (see filter_pylog).
+	"""
+	table=filename if isinstance(filename,EventTable) else filter_pylog(str(filename),'data',kwargs.get('cache',False))
+	pairs=pair_photocell(table.onset[table.select(*event_tags)],table.onset[table.select(pc_tag)],
+		kwargs.get('max_lag',MAX_PC_LAG))
+	diff_pypc=np.round(pairs.latency,3)
 	#give simple text warning if difference exceeds over 15ms
-	for i in range(0,len(diff_pypc)):
-		if diff_pypc[i] >= 15:
-			print("Warning: big diff at Py index# " + str(i) + ": " + str(diff_pypc[i]) + " (above 15ms)")
+	warn_big_diff(diff_pypc,'Py')
+	warn_unmatched(pairs,'Py')
 	if len(diff_pypc) != 0:
-		avg_pypc=round(sum(diff_pypc)/len(diff_pypc),1)
-	return avg_pypc
+		return round(float(diff_pypc.mean()),1)
 
 
 ### NetStation Photocell Timing ###
-def photocell_ns(filename, *event_tags):
+@stage('photocell_ns')
+def photocell_ns(filename, *event_tags, **kwargs):
 	"""
-	Syntax: photocell_ns(string of filename w/o extension, 'custom event tags')
+	Syntax: photocell_ns(string of filename w/o extension, 'custom event tags', max_lag=ms, cache=False)
 	Example: photocell_py('test2','ope','clo','gaz')
 
-	This function takes in csv filename of NetStation event log, and measures time difference of each
-	photocell tag - previous event tag = photocell time delay
+	This function takes in filename of NetStation event log (or its EventTable from filter_nslog), and measures time difference of each
+	photocell tag - paired event tag = photocell time delay (see pair_photocell).
+	max_lag (default MAX_PC_LAG) is the longest delay still paired with an event tag.
 
 	***Note: unlike PsychoPy log, NetStation photocell label is fixed as DIN3 or DIN'X'
-	Also, there is an extra DIN3 at the end, so the last one is not counted.
-	"""
-	filtered_pc,diff_nspc=[],[]
-	din3_sort, din3_diff=[],[]
-	nsdata=filter_nslog(str(filename))
-	#append DIN3 labeled events
-	for i in range(0,len(nsdata)-1):
-		if (nsdata[i][0]=='DIN3'):
-			filtered_pc.append(nsdata[i])
-	#append custom event tags
-	for event in event_tags:
-		for i in range(0,len(nsdata)-1):
-			if nsdata[i][0][0:3]==str(event):
-				filtered_pc.append(nsdata[i])
-	#sort list in time onset order
-	filtered_pc=sorted(filtered_pc, key=lambda x: int(x[4]))
-	#calculate photocell timing difference
-	for i in range(0,len(filtered_pc)):
-		if filtered_pc[i][0]=='DIN3':
-			diff_nspc.append(filtered_pc[i][4]-filtered_pc[i-1][4])
-
+	Extra DIN3s (ie. the one at the end) are reported as unmatched instead of being counted.
+	cache=True reads the export through pyns_cache (see filter_nslog).
+	"""
+	table=filename if isinstance(filename,EventTable) else filter_nslog(str(filename),kwargs.get('cache',False))
+	pairs=pair_photocell(table.onset[table.select(*event_tags)],table.onset[table.tag_mask('DIN3')],
+		kwargs.get('max_lag',MAX_PC_LAG))
+	diff_nspc=pairs.latency
 	#give simple text warning if difference exceeds over 15ms
-	for i in range(0, len(diff_nspc)):
-		if diff_nspc[i] >= 15:
-			print("WARNING: big diff at NS Photocell index# " + str(i) + ": " + str(diff_nspc[i]) + " (above 15ms)")
+	warn_big_diff(diff_nspc,'NS Photocell')
+	warn_unmatched(pairs,'NS Photocell')
 	if len(diff_nspc) != 0:
-		avg_nspc=round(sum(diff_nspc)/len(diff_nspc),1)
-	return avg_nspc
+		return round(float(diff_nspc.mean()),1)
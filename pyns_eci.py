@@ -0,0 +1,359 @@
+"""
+Local stand-in for the NetStation ECI server (10.0.0.42:55513), for offline tests and benchmarks.
+
+EciServer speaks the subset of the Experimental Control Interface used by egi.simple.Netstation:
+    'Q' + 'NTEL'/'UNIX'   BeginSession (byte order of the client)  -> 'I' + version byte
+    'X'                   EndSession                               -> 'Z'
+    'B' / 'E'             StartRecording / StopRecording           -> 'Z'
+    'A', 'T' + uint32     sync: attention + local time (ms)        -> 'Z'
+    'D' + uint16 size + int32 time + uint32 duration + 4s code + label, description, key table  -> 'Z'
+    anything else                                                  -> 'F' + 4 bytes
+Arrivals are stamped with a monotonic clock. Like NetStation, an event onset is its local timestamp mapped
+through the last sync (arrival of 'T' <-> its local time), relative to the start of the recording.
+Events sent while recording are written as a NetStation event export laid out like example_nslog,
+ready for filter_nslog / pyns_run.
+
+EciClient is a minimal client with the interface of egi.simple.Netstation (same wire format), for Python
+versions the egi package does not run on.
+
+Example:
+    server = EciServer(export='/tmp/eci_nslog').start()
+    ns = egi.Netstation()
+    ns.connect('127.0.0.1', server.port)
+    ...
+    server.stop()                    # writes /tmp/eci_nslog
+
+    python pyns_eci.py --port 55513 --export data/nslog   # until Ctrl-C
+"""
+from __future__ import print_function
+import socket
+import struct
+import sys
+import threading
+import time
+from collections import namedtuple
+from pyns_send import local_ms
+from pyns_synth import ns_time
+
+try:
+    monotonic = time.monotonic
+except AttributeError:
+    from timeit import default_timer as monotonic
+
+ECI_PORT = 55513
+ECI_VERSION = 1
+# unpack format of the key table values, by ECI type ('doub' is always sent big endian by egi.simple)
+TABLE_TYPES = {'long': 'l', 'shor': 'h', 'bool': '?', 'sing': 'f', 'doub': '!d'}
+
+EciEvent = namedtuple('EciEvent', ['code', 'label', 'description', 'table', 'timestamp', 'duration', 'arrival', 'onset'])
+
+
+def monotonic_ms():
+    """Monotonic clock in ms (float)."""
+    return monotonic() * 1000
+
+
+class EciSession(object):
+    """State of one client connection: byte order, last sync, recording and received events."""
+    def __init__(self, server, connection):
+        self.server = server
+        self.connection = connection
+        self.order = '<'
+        self.sync = None
+
+    def read(self, size):
+        """Exactly size bytes from the client (EOFError if it disconnects)."""
+        data = b''
+        while len(data) < size:
+            chunk = self.connection.recv(size - len(data))
+            if not chunk:
+                raise EOFError
+            data += chunk
+        return data
+
+    def pstring(self, data, start):
+        """(text, next position) of the one byte counted string at data[start]."""
+        length = struct.unpack('B', data[start:start + 1])[0]
+        return data[start + 1:start + 1 + length].decode('latin-1'), start + 1 + length
+
+    def table(self, data, start):
+        """Key table {key: value} packed by egi.simple after the description."""
+        table = {}
+        count = struct.unpack('B', data[start:start + 1])[0]
+        start += 1
+        for i in range(count):
+            key, kind, length = struct.unpack(self.order + '4s4sH', data[start:start + 10])
+            value = data[start + 10:start + 10 + length]
+            kind = kind.decode('latin-1')
+            if kind == 'TEXT':
+                value = value.decode('latin-1')
+            elif kind in TABLE_TYPES:
+                fmt = TABLE_TYPES[kind]
+                value = struct.unpack(fmt if fmt[0] == '!' else self.order + fmt, value)[0]
+            table[key.decode('latin-1')] = value
+            start += 10 + length
+        return table
+
+    def event(self, arrival):
+        """Reads the rest of a 'D' command and records the event."""
+        size = struct.unpack(self.order + 'H', self.read(2))[0]
+        data = self.read(size)
+        timestamp, duration, code = struct.unpack(self.order + 'lL4s', data[:12])
+        label, description, table = '', '', {}
+        if len(data) > 12:
+            label, start = self.pstring(data, 12)
+            description, start = self.pstring(data, start)
+            table = self.table(data, start)
+        if self.sync is None:
+            onset = arrival
+        else:
+            onset = self.sync[0] + timestamp - self.sync[1]
+        self.server.record(EciEvent(code.decode('latin-1'), label, description, table, timestamp, duration,
+                                    arrival, onset))
+
+    def serve(self):
+        """Answers commands until the client disconnects or ends the session."""
+        while True:
+            try:
+                command = self.read(1)
+            except EOFError:
+                return
+            arrival = monotonic_ms()
+            if command == b'Q':
+                self.order = '>' if self.read(4) == b'UNIX' else '<'
+                self.connection.sendall(b'I' + struct.pack('B', ECI_VERSION))
+                continue
+            if command == b'T':
+                self.sync = (arrival, struct.unpack(self.order + 'L', self.read(4))[0])
+                self.server.synced(arrival)
+            elif command == b'D':
+                self.event(arrival)
+            elif command == b'B':
+                self.server.recording(True, arrival)
+            elif command == b'E':
+                self.server.recording(False, arrival)
+            elif command == b'X':
+                self.connection.sendall(b'Z')
+                self.server.end_session()
+                return
+            elif command != b'A':
+                self.connection.sendall(b'F' + struct.pack(self.order + 'h', -1) + b'\x00\x00')
+                continue
+            self.connection.sendall(b'Z')
+
+
+class EciServer(object):
+    """
+    Syntax: EciServer(host='127.0.0.1', port=0, export=None)
+
+    Threaded ECI stand-in (port=0 picks a free port, see .port). Received events are kept in .events;
+    the recorded ones are written as a NetStation export to export (if given) when a session ends or
+    the server stops, or on demand with write_export(path).
+    """
+    def __init__(self, host='127.0.0.1', port=0, export=None):
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listener.bind((host, port))
+        self.listener.listen(1)
+        self.host, self.port = self.listener.getsockname()
+        self.export = export
+        self.events = []
+        # [start, stop] arrival times of every recording, in ms
+        self.recordings = []
+        self.first_sync = None
+        self.lock = threading.Lock()
+        self.thread = None
+        self.running = False
+
+    def start(self):
+        """Accepts clients on a daemon thread, one connection at a time."""
+        self.running = True
+        self.thread = threading.Thread(target=self.accept, name='pyns-eci')
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def accept(self):
+        """Server thread: serves connections until stop()."""
+        while self.running:
+            try:
+                connection = self.listener.accept()[0]
+            except (OSError, socket.error):
+                return
+            connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            try:
+                EciSession(self, connection).serve()
+            except (OSError, socket.error, struct.error):
+                pass
+            finally:
+                connection.close()
+
+    def record(self, event):
+        """Keeps one received event."""
+        with self.lock:
+            self.events.append(event)
+
+    def synced(self, arrival):
+        """Notes the first sync of a recording (NetStation logs it as a 'sync' calibration row)."""
+        if self.first_sync is None and self.is_recording():
+            self.first_sync = arrival
+
+    def is_recording(self):
+        """True between StartRecording and StopRecording."""
+        return bool(self.recordings) and self.recordings[-1][1] is None
+
+    def recording(self, start, arrival):
+        """StartRecording (start=True) / StopRecording at arrival."""
+        with self.lock:
+            if start and not self.is_recording():
+                self.recordings.append([arrival, None])
+            elif not start and self.is_recording():
+                self.recordings[-1][1] = arrival
+
+    def end_session(self):
+        """EndSession: stops the recording and writes the export."""
+        self.recording(False, monotonic_ms())
+        if self.export:
+            self.write_export(self.export)
+
+    def recorded(self):
+        """(code, label, onset ms from the recording start, duration ms) of the events sent while recording."""
+        with self.lock:
+            events = list(self.events)
+            recordings = [(start, monotonic_ms() if stop is None else stop) for start, stop in self.recordings]
+        if not recordings:
+            return []
+        rows = []
+        origin = recordings[0][0]
+        if self.first_sync is not None:
+            rows.append(('sync', 'Amp time', 'Calibration', self.first_sync - origin, 1))
+        for event in events:
+            if any(start <= event.arrival <= stop for start, stop in recordings):
+                rows.append((event.code, event.label, 'ECI TCP/IP ' + str(self.port), event.onset - origin,
+                             event.duration))
+        rows.sort(key=lambda row: row[3])
+        return rows
+
+    def write_export(self, path):
+        """Writes the recorded events as a NetStation event export (layout of example_nslog)."""
+        with open(path, 'w') as nsFile:
+            nsFile.write('Recording 1\nTime Mode: Relative Time\nCode\tLabel\tType\tTrack\tOnset\tDuration\n')
+            for code, label, track, onset, duration in self.recorded():
+                onset = ns_time(max(0, int(round(onset))))
+                nsFile.write('%s\t%s\tStimulus Event\t%s\t_%02d:%02d:%02d.%03d\t_%02d:%02d:%02d.%03d\t\n' %
+                             ((code, label, track) + onset + ns_time(int(duration))))
+        return path
+
+    def stop(self):
+        """Stops accepting clients and writes the export (if any)."""
+        self.running = False
+        try:
+            self.listener.shutdown(socket.SHUT_RDWR)
+        except (OSError, socket.error):
+            pass
+        self.listener.close()
+        if self.thread is not None:
+            self.thread.join(1.0)
+        if self.export:
+            self.write_export(self.export)
+
+
+class EciClient(object):
+    """
+    Syntax: EciClient() then connect(host, port), like egi.simple.Netstation
+
+    Blocking ECI client: every command waits for the server response, as egi.simple does.
+    """
+    def __init__(self):
+        self.connection = None
+        self.version = None
+
+    def connect(self, host, port):
+        """Opens the TCP connection (Nagle off: commands are tiny)."""
+        self.connection = socket.create_connection((host, port))
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def disconnect(self):
+        """Closes the connection."""
+        self.connection.close()
+
+    def response(self):
+        """Reads the server response: True for 'Z', the version for 'I'; raises IOError for 'F'."""
+        code = self.connection.recv(1)
+        if code == b'Z':
+            return True
+        if code == b'I':
+            self.version = struct.unpack('B', self.connection.recv(1))[0]
+            return self.version
+        if code == b'F':
+            raise IOError('ECI server returned an error: ' + repr(self.connection.recv(4)))
+        raise IOError('unexpected ECI response: ' + repr(code))
+
+    def command(self, message):
+        """Sends message and returns the response."""
+        self.connection.sendall(message)
+        return self.response()
+
+    def BeginSession(self):
+        return self.command(b'Q' + (b'NTEL' if sys.byteorder == 'little' else b'UNIX'))
+
+    def EndSession(self):
+        return self.command(b'X')
+
+    def StartRecording(self):
+        return self.command(b'B')
+
+    def StopRecording(self):
+        return self.command(b'E')
+
+    def sync(self, timestamp=None):
+        """Attention + local time, like egi.simple.Netstation.sync."""
+        self.command(b'A')
+        return self.command(struct.pack('=cL', b'T', local_ms() if timestamp is None else timestamp))
+
+    def send_event(self, key, timestamp=None, label=None, description=None, table=None, pad=False):
+        """Sends one event packed like egi.simple (pad=True fits the key to 4 characters)."""
+        key = str(key)
+        if pad:
+            key = (key + '    ')[:4]
+        rest = pstring(label) + pstring(description) + pack_table(table)
+        header = struct.pack('=cH2L4s', b'D', 12 + len(rest), local_ms() if timestamp is None else timestamp, 1,
+                             key.encode('latin-1'))
+        return self.command(header + rest)
+
+
+def pstring(text):
+    """One byte counted string (at most 255 characters)."""
+    text = (text or '')[:255].encode('latin-1')
+    return struct.pack('B', len(text)) + text
+
+
+def pack_table(table):
+    """Key count + (4 char key, ECI type, uint16 length, value) per entry, as egi.simple packs tables (pad=True)."""
+    table = table or {}
+    packed = [struct.pack('B', len(table))]
+    for key, value in table.items():
+        if isinstance(value, bool):
+            kind, data = b'bool', struct.pack('=?', value)
+        elif isinstance(value, int):
+            kind, data = b'long', struct.pack('=l', value)
+        elif isinstance(value, float):
+            kind, data = b'doub', struct.pack('!d', value)
+        else:
+            kind, data = b'TEXT', str(value).encode('latin-1')
+        packed.append((str(key) + '    ')[:4].encode('latin-1') + kind + struct.pack('=H', len(data)) + data)
+    return b''.join(packed)
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    options = dict((args[i], args[i + 1]) for i in range(len(args) - 1) if args[i].startswith('--'))
+    server = EciServer(options.get('--host', '127.0.0.1'), int(options.get('--port', ECI_PORT)),
+                       options.get('--export')).start()
+    print('ECI stand-in listening on %s:%d, Ctrl-C to stop' % (server.host, server.port))
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.stop()
+        print('%d events received' % len(server.events))
@@ -0,0 +1,100 @@
+"""
+Compact structured event log written alongside the PsychoPy text log.
+
+The PsychoPy LogFile at DEBUG level formats and writes every EXP object repr of the session, while the
+analyses only need our ~170 events. EventLog records just those events, one fixed-record JSON line each:
+    {"code": "sbli", "ms": 333928907, "frame": 120, "flip": null, "ns_latency": 0.412}
+    code: event code, ms: local time (egi.ms_localtime clock), frame: frame number or null,
+    flip: local ms of the screen flip for flip-locked events or null,
+    ns_latency: ms from the send call to the NetStation acknowledgement, or null if not sent.
+event() only appends a tuple to a deque; a writer thread formats and writes the records in batches
+every FLUSH_INTERVAL seconds, so the frame loop does no file I/O.
+
+read_evlog loads the file back as a pyns_core EventTable (onset = ms), ready for filter_pyevent /
+timediff_py, without parsing a PsychoPy log.
+
+Example:
+    evlog = EventLog('data/eog_blinks_001/eog_blinks_001.events.jsonl').start()
+    sender = AsyncSender(ns, ms_localtime, log=evlog).start()   # logs every event sent, with its latency
+    evlog.event('blank', frame=0)                               # events not sent to NetStation
+    evlog.close()
+    py_event = filter_pyevent(read_evlog('data/eog_blinks_001/eog_blinks_001.events.jsonl'), 'sbl', 'scl')
+"""
+from __future__ import print_function
+import collections
+import json
+import threading
+from pyns_send import local_ms
+
+# seconds between two batches written by the writer thread
+FLUSH_INTERVAL = 0.5
+EVLOG_FIELDS = ('code', 'ms', 'frame', 'flip', 'ns_latency')
+
+
+class EventLog(object):
+    """
+    Syntax: EventLog('path of the .jsonl file', clock=local_ms, flush_interval=0.5)
+
+    Thread safe event recorder; start() the writer thread, close() writes the rest and closes the file.
+    """
+    def __init__(self, path, clock=None, flush_interval=FLUSH_INTERVAL):
+        self.path = path
+        self.clock = clock if clock is not None else local_ms
+        self.flush_interval = flush_interval
+        self.queue = collections.deque()
+        self.done = threading.Event()
+        self.thread = None
+        self.written = 0
+
+    def start(self):
+        """Opens the file and starts the writer thread; returns the log."""
+        self.file = open(self.path, 'w')
+        self.thread = threading.Thread(target=self.run, name='pyns-evlog')
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def event(self, code, ms=None, frame=None, flip=None, ns_latency=None):
+        """Records one event (ms defaults to now on the log clock); costs one deque append."""
+        self.queue.append((str(code), self.clock() if ms is None else ms, frame, flip, ns_latency))
+
+    def write_batch(self):
+        """Writes and flushes every queued record (writer thread)."""
+        lines = []
+        while self.queue:
+            record = self.queue.popleft()
+            lines.append(json.dumps(collections.OrderedDict(zip(EVLOG_FIELDS, record)), separators=(',', ':')))
+        if lines:
+            self.file.write('\n'.join(lines) + '\n')
+            self.file.flush()
+            self.written += len(lines)
+
+    def run(self):
+        """Writer thread: one batch every flush_interval seconds until close()."""
+        while not self.done.wait(self.flush_interval):
+            self.write_batch()
+        self.write_batch()
+
+    def close(self):
+        """Writes the queued records, stops the writer thread and closes the file."""
+        self.done.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.file.close()
+
+
+def read_evlog(path):
+    """
+    Syntax: read_evlog('path of the .jsonl event log')
+
+    EventTable (source PsychoPy) of the event log: onset = ms, label = code.
+    """
+    from pyns_core import EventTable, SOURCE_PY
+    onset, labels = [], []
+    with open(path) as evFile:
+        for line in evFile:
+            if line.strip():
+                record = json.loads(line)
+                onset.append(float(record['ms']))
+                labels.append(record['code'])
+    return EventTable.from_events(onset, labels, SOURCE_PY)
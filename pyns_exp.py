@@ -20,6 +20,9 @@ from numpy.random import random, randint, normal, shuffle
 import os
 import sys
 import decimal
+from pyns_sound import SoundBank
+from pyns_evlog import EventLog
+from pyns_schedule import session_plan, CueScheduler, BLANK, SHOW, CUE
 
 
 ##########################################
@@ -31,6 +34,10 @@ seq = [1, 1, 1, 1, 1, 2, 2, 2, 2, 2, 2, 3, 3, 3, 3, 3]
 # switches #
 netstation  = False  # False to run the file locally w/o NetStation connection
 recording   = False  # True starts recording NetStation automatically
+ns_host     = '10.0.0.42'  # '127.0.0.1' to test against a local stand-in (python pyns_eci.py)
+event_log   = True   # True writes our events to <exp>.events.jsonl (pyns_evlog), off the frame loop
+log_level   = logging.DATA  # PsychoPy .log level: DATA keeps the lines the analyses read, WARNING once they
+                            # read the event log (pyns_evlog.read_evlog), DEBUG for the full verbose log
 
 #--------------------------------------------------------------------------#
 # vars             | values     | default     | description                #
@@ -85,6 +92,7 @@ if netstation:
     ms_localtime = egi.ms_localtime
     ns = egi.Netstation()
     print("Imported PyNetstation")
+    from pyns_send import AsyncSender
 
 
 # create window
@@ -98,11 +106,14 @@ if os.path.isdir(filename):
     core.quit()
 if not os.path.isdir(filename):
     os.makedirs(filename)
+evlog = EventLog(os.path.join(filename, exp_summary + '.events.jsonl'),
+                 ms_localtime if netstation else None).start() if event_log else None
 
 
 # set text instructions
 instructions = "Hello,\n\nSounds will be played, instructing what to do. \nYou will be told to OPEN/CLOSE eyes, BLINK, or LOOK at a specific direction. When looking at a specific direction, make sure you look at the direction and then LOOK BACK at the center.\n\nPress spacebar to begin."
 ending = "You are done with the eye blink experiment!\n\nclosing..."
+pause_text = "Paused\n\nPress " + pauseKey + " to resume."
 
 
 InstrText = visual.TextStim(
@@ -110,6 +121,11 @@ InstrText = visual.TextStim(
     pos=(0, 0), height=0.9, wrapWidth=None, ori=0,
     color='white', colorSpace='rgb', opacity=1,
     depth=0.0,units='cm') # alignHoriz='center',alignVert='center'
+pauseLabel = visual.TextStim(
+    win=win,text=pause_text,font='Arial',
+    pos=(0, 0), height=0.9, wrapWidth=None, ori=0,
+    color='white', colorSpace='rgb', opacity=1,
+    depth=0.0,units='cm')
 center = visual.ShapeStim(win=win, name='center', units='cm',vertices='cross',
     size=(cross_size, cross_size),
     ori=0, pos=(0, 0),
@@ -142,37 +158,28 @@ down = visual.ShapeStim(win=win, name='down', units='cm',vertices='cross',
     opacity=1, depth=0.0, interpolate=True)
 
 
-# Sound components
-sound_close = sound.Sound('./sound/close_speak.wav')
-sound_close.setVolume(1)
-sound_open = sound.Sound('./sound/open_speak.wav')
-sound_open.setVolume(1)
-sound_blink = sound.Sound('./sound/blink_speak.wav')
-sound_blink.setVolume(1)
-sound_left = sound.Sound('./sound/left_speak.wav')
-sound_left.setVolume(1)
-sound_right = sound.Sound('./sound/right_speak.wav')
-sound_right.setVolume(1)
-sound_up = sound.Sound('./sound/up_speak.wav')
-sound_up.setVolume(1)
-sound_down = sound.Sound('./sound/down_speak.wav')
-sound_down.setVolume(1)
+# Sound components: decoded in the background while the instructions are shown
+bank = SoundBank(os.path.join(stimDir, 'sound')).start()
 
 
 # helper functions:
 def send_to_NS(type):
+    # queued with the current time, the sender thread does the network round-trips (and writes the event log)
     if netstation:
-        ns.sync()
-        ns.send_event(key=str(type), timestamp=None, pad=False)
+        sender.send(type)
         logging.data('sent to NS: ' + str(type))
+    elif evlog is not None:
+        evlog.event(type)
 
 
 def pause_or_quit():
+    # returns the seconds spent paused, so the schedule can be shifted by as much
     if event.getKeys(keyList=[endKey]):
         print('esc quit')
         win.close()
         core.quit()
     if event.getKeys(keyList=[pauseKey]):
+        paused = globalClock.getTime()
         event.clearEvents('keyboard')
         pauseLabel.draw()
         win.logOnFlip('paused', level=logging.DATA)
@@ -180,6 +187,8 @@ def pause_or_quit():
         print('PAUSE')
         event.waitKeys(keyList=[pauseKey], timeStamped=globalClock)
         print('RESUME')
+        return globalClock.getTime() - paused
+    return 0
 
 
 def blanks():
@@ -188,15 +197,15 @@ def blanks():
     win.flip()
 
 
-def blank_screen():
-    for frameN in range(int(round(dur_blank * 60))):
-        if frameN == 0:
-        #     send_to_NS(type, index)
-            win.logOnFlip('start blank', level=logging.DATA)
-        if frameN == int(round(dur_blank * 60)) - 1:
-            win.logOnFlip('end blank', level=logging.DATA)
-        pause_or_quit()
+def blank_screen(until):
+    # blank frames until the last flip before `until` (s on the schedule), the next step waits for its own target
+    win.logOnFlip('start blank', level=logging.DATA)
+    if netstation:
+        sender.idle()  # nothing is sent during the blank: resync the clocks now if needed
+    while timer.now() < until - 1 / 60:
+        timer.shift(pause_or_quit())
         blanks()
+    logging.data('end blank')
 
 
 def show_screen():
@@ -218,7 +227,7 @@ globalClock = core.Clock()
 # starts logging
 logging.setDefaultClock(globalClock)
 logging.console.setLevel(logging.ERROR) # logging.DATA
-logDat = logging.LogFile(stimDir + '/data/' + str(exp_summary) + '/'+ str(exp_summary) + '.log', filemode='w', level=logging.DEBUG)
+logDat = logging.LogFile(stimDir + '/data/' + str(exp_summary) + '/'+ str(exp_summary) + '.log', filemode='w', level=log_level)
 
 
 # Instructions
@@ -229,72 +238,71 @@ win.flip()
 inst_key = event.waitKeys(keyList=['space'], timeStamped=int_timer)
 pause_or_quit()
 
+# cues built once from memory, the blocks below do no disk I/O
+sound_close = bank.sound('close_speak')
+sound_open = bank.sound('open_speak')
+sound_blink = bank.sound('blink_speak')
+sound_left = bank.sound('left_speak')
+sound_right = bank.sound('right_speak')
+sound_up = bank.sound('up_speak')
+sound_down = bank.sound('down_speak')
+logging.info('sound bank: ' + str(bank.report()))
+
 
 # NetStation
 if netstation:
-    ns.connect('10.0.0.42', 55513)
+    ns.connect(ns_host, 55513)
     ns.BeginSession()
     print("Connected to Netstation")
     if recording:
         ns.StartRecording()
         print("Recording ...")
+    sender = AsyncSender(ns, ms_localtime, log=evlog).start()
 
 
 ##########################################
 #         Begin Experiment Loop          #
 ##########################################
-for i in range(0, len(seq)):
-    blank_screen()
+# every blank, cross display and cue of the session gets its target time up front (pyns_schedule)
+cue_sounds = {'blik': sound_blink, 'open': sound_close, 'clos': sound_open,
+              'left': sound_left, 'rigt': sound_right, 'uupp': sound_up, 'down': sound_down}
+gaze_codes = {'l': 'left', 'r': 'rigt', 'u': 'uupp', 'd': 'down'}
+blocks = []
+for block in seq:
     # 1 = blinks
-    if i == 1:
-        sound_blink.setSound('./sound/blink_speak.wav')
-        for i in range(0, blink_per_block):
-            pause_or_quit()
-            show_screen()
-            core.wait(blink_isi / 2)
-            sound_blink.play()
-            send_to_NS('blik')
-            core.wait(blink_isi / 2)
-
+    if block == 1:
+        blocks.append(('blink', blink_isi, ['blik'] * blink_per_block))
     # 2 = open/close
-    if i == 2:
-        sound_close.setSound('./sound/close_speak.wav')
-        sound_open.setSound('./sound/open_speak.wav')
-        for j in oc_seq:
-            pause_or_quit()
-            show_screen()
-            core.wait(openclose_isi / 2)
-            if j == 1:
-                sound_close.play()
-                send_to_NS('open')
-            if j == 2:
-                sound_open.play()
-                send_to_NS('clos')
-            core.wait(openclose_isi / 2)
-
+    if block == 2:
+        blocks.append(('openclose', openclose_isi, ['open' if j == 1 else 'clos' for j in oc_seq]))
     # 3 = look left/right/up/down
-    if i == 3:
-        sound_left.setSound('./sound/left_speak.wav')
-        sound_right.setSound('./sound/right_speak.wav')
-        sound_up.setSound('./sound/up_speak.wav')
-        sound_down.setSound('./sound/down_speak.wav')
-        for j in gaze_seq:
-            pause_or_quit()
-            show_screen()
-            core.wait(gaze_isi / 2)
-            if j == 'l':
-                sound_left.play()
-                send_to_NS('left')
-            if j == 'r':
-                sound_right.play()
-                send_to_NS('rigt')
-            if j == 'u':
-                sound_up.play()
-                send_to_NS('uupp')
-            if j == 'd':
-                sound_down.play()
-                send_to_NS('down')
-            core.wait(gaze_isi / 2)
+    if block == 3:
+        blocks.append(('gaze', gaze_isi, [gaze_codes[j] for j in gaze_seq]))
+plan = session_plan(blocks, dur_blank)
+
+timer = CueScheduler().start()
+for target, block, kind, code in plan:
+    if kind == BLANK:
+        # the crosses of the last trial stay up until the blank's own target (isi / 2 after the last cue)
+        timer.shift(pause_or_quit())
+        actual = timer.wait_until(target)
+        timer.record(block, kind, code, target, actual)
+        blank_screen(target + dur_blank)
+    elif kind == SHOW:
+        timer.shift(pause_or_quit())
+        actual = timer.wait_until(target)
+        show_screen()
+        timer.record(block, kind, code, target, actual)
+    elif kind == CUE:
+        actual = timer.wait_until(target)
+        cue_sounds[code].play()
+        send_to_NS(code)
+        timer.record(block, kind, code, target, actual)
+    else:
+        timer.wait_until(target)  # end of the last trial
+timer.write(os.path.join(filename, exp_summary + '_timing.csv'))
+print('cue timing: ' + str(timer.summary()))
+logging.info('cue timing: ' + str(timer.summary()))
 
 
 # end the experiment
@@ -307,8 +315,13 @@ core.wait(2)
 print('end of experiment!')
 
 # end netstation recording
-if netstation and recording:
-    ns.StopRecording()
+if netstation:
+    if recording:
+        sender.call('StopRecording')
+    sender.close()
+    print('NetStation sync: ' + str(sender.scheduler.metrics()))
+if evlog is not None:
+    evlog.close()
 
 # exit out
 core.wait(2)
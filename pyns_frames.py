@@ -0,0 +1,169 @@
+"""
+Frame schedules for the block loops of basic/pyns_exp_photodiode.py.
+
+Each block (blinks, open/close, gaze) is compiled once into a dict frame -> tuple of actions, so the
+render loop only does schedule.get(frameN, ()) per frame instead of re-testing every cue frame and
+rescanning the photocell on/off lists:
+    (SHOW,)                    show the crosses
+    (CUE, key, frame_count)    play the sound of key and send key to NetStation (logged with the frame count)
+    (PC_ON,) / (PC_OFF,)       photocell square on (logged as wsqS) / off
+    (HIDE,)                    hide the crosses (ITI)
+Frames are counted from 1 as in the script; the actions of a frame run in the order above.
+
+FrameRecorder records the time of every flip into a preallocated ring buffer (no allocation per frame),
+together with the events sent on each frame. At the end of a block, intervals above DROP_RATIO x the nominal
+refresh count as dropped frames and are attributed to the events sent while that frame was prepared;
+write_summary saves one csv row per block next to the PsychoPy .log.
+Nothing here needs PsychoPy or a display.
+
+Example:
+    cues = blink_cues(blink_per_block, blink_isi)
+    schedule = compile_block(dur_blink, cues, pc_delay=20, pc_duration=dur_whitesquare, iti=dur_iti)
+    schedule[120] --> (('cue', 'sbli', True),)
+
+    frames = FrameRecorder(1.0 / win.getActualFrameRate())
+    frames.start_block('blink')
+    frames.flip(win.flip()); frames.note('sbli') ...
+    frames.end_block()
+    frames.write_summary(filename + '_frames.csv')
+"""
+from __future__ import division
+import csv
+from timeit import default_timer
+import numpy as np
+
+SHOW = 'show'
+CUE = 'cue'
+PC_ON = 'pc_on'
+PC_OFF = 'pc_off'
+HIDE = 'hide'
+# frames each cue takes on top of the inter-cue interval (one second at 60 Hz)
+CUE_FRAMES = 60
+# flips kept by FrameRecorder: must cover the longest block
+FRAME_CAPACITY = 4096
+EVENT_CAPACITY = 1024
+# an interval longer than DROP_RATIO x the refresh period counts as a dropped frame
+DROP_RATIO = 1.5
+NOMINAL_REFRESH = 1.0 / 60
+BLOCK_FIELDS = ['block', 'frames', 'refresh_ms', 'mean_ms', 'max_ms', 'dropped', 'dropped_with_events', 'drop_events']
+GAZE_KEYS = {'l': 'slef', 'r': 'srig', 'u': 's_up', 'd': 'sdow'}
+
+
+def cue_frame(i, isi, cue_frames=CUE_FRAMES):
+    """Frame of the i-th cue of a block: isi * i + cue_frames * (i - 1)."""
+    return isi * i + cue_frames * (i - 1)
+
+
+def blink_cues(per_block, isi):
+    """[(frame, 'sbli', True)] of the blink block."""
+    return [(cue_frame(i, isi), 'sbli', True) for i in range(1, per_block + 1)]
+
+
+def openclose_cues(oc_seq, isi):
+    """[(frame, key, True)] of the open/close block: 'sclo' on odd cues, 'sope' on even ones."""
+    return [(cue_frame(i, isi), 'sclo' if i % 2 != 0 else 'sope', True) for i in range(1, len(oc_seq) + 1)]
+
+
+def gaze_cues(gaze_seq, isi):
+    """[(frame, key, False)] of the gaze block; gaze_seq[0] is the empty placeholder of the script."""
+    return [(cue_frame(i, isi), GAZE_KEYS[gaze_seq[i]], False) for i in range(1, len(gaze_seq))]
+
+
+def compile_block(n_frames, cues, pc_delay=20, pc_duration=1, iti=10, photocell=True):
+    """
+    Syntax: compile_block(frames in the block, [(frame, key, log frame count)], pc_delay=20, pc_duration=1, iti=10, photocell=True)
+
+    Returns {frame: (action, ...)} for frames 1..n_frames: crosses shown from frame 1, each cue at its frame,
+    the photocell square pc_delay frames after each cue for pc_duration frames, crosses hidden from frame
+    n_frames - iti + 1 on (the ITI). Actions falling after the last frame are dropped.
+    """
+    schedule = {}
+
+    def add(frame, action):
+        if 1 <= frame <= n_frames:
+            schedule.setdefault(frame, []).append(action)
+
+    add(1, (SHOW,))
+    for frame, key, frame_count in cues:
+        add(frame, (CUE, key, frame_count))
+    if photocell:
+        for frame, key, frame_count in cues:
+            add(frame + pc_delay, (PC_ON,))
+        for frame, key, frame_count in cues:
+            add(frame + pc_delay + pc_duration, (PC_OFF,))
+    add(n_frames - iti + 1, (HIDE,))
+    return dict((frame, tuple(actions)) for frame, actions in schedule.items())
+
+
+class FrameRecorder(object):
+    """
+    Syntax: FrameRecorder(refresh period in s (None: 60 Hz), capacity=4096, drop_ratio=1.5)
+
+    Flip timestamps in a ring buffer of capacity frames, events noted per frame, one summary dict per block.
+    """
+    def __init__(self, refresh=None, capacity=FRAME_CAPACITY, drop_ratio=DROP_RATIO, event_capacity=EVENT_CAPACITY):
+        self.refresh = refresh or NOMINAL_REFRESH
+        self.capacity = capacity
+        self.drop_ratio = drop_ratio
+        self.times = np.zeros(capacity)
+        self.count = 0
+        # frame (flip count when noted) and key of the events, also ring buffers
+        self.event_frames = np.full(event_capacity, -1, dtype=np.int64)
+        self.event_keys = np.empty(event_capacity, dtype=object)
+        self.event_count = 0
+        self.block = None
+        self.block_start = 0
+        self.block_events = 0
+        self.blocks = []
+
+    def flip(self, timestamp):
+        """Records one flip time (s), ie. frames.flip(win.flip()); None (no flip time returned) uses default_timer."""
+        if timestamp is None:
+            timestamp = default_timer()
+        self.times[self.count % self.capacity] = timestamp
+        self.count += 1
+
+    def note(self, key):
+        """Notes an event sent while the next frame is prepared (it is blamed if that frame is late)."""
+        i = self.event_count % len(self.event_frames)
+        self.event_frames[i] = self.count
+        self.event_keys[i] = key
+        self.event_count += 1
+
+    def start_block(self, name):
+        """Starts a block: its summary covers the flips from now to end_block()."""
+        self.block = name
+        self.block_start = self.count
+        self.block_events = self.event_count
+
+    def end_block(self):
+        """Summarizes the flips of the current block and returns the summary dict (see BLOCK_FIELDS)."""
+        first = max(self.block_start, self.count - self.capacity)
+        flips = np.arange(first, self.count)
+        intervals = np.diff(self.times[flips % self.capacity]) * 1000
+        late = flips[1:][intervals > self.drop_ratio * self.refresh * 1000]
+        first_event = max(self.block_events, self.event_count - len(self.event_frames))
+        events = np.arange(first_event, self.event_count) % len(self.event_frames)
+        blamed = {}
+        with_events = 0
+        for frame in late:
+            keys = self.event_keys[events[self.event_frames[events] == frame]]
+            with_events += len(keys) > 0
+            for key in keys:
+                blamed[key] = blamed.get(key, 0) + 1
+        summary = {'block': self.block, 'frames': self.count - self.block_start, 'refresh_ms': round(self.refresh * 1000, 3),
+                   'mean_ms': round(float(intervals.mean()), 3) if len(intervals) else None,
+                   'max_ms': round(float(intervals.max()), 3) if len(intervals) else None,
+                   'dropped': len(late), 'dropped_with_events': with_events,
+                   'drop_events': ' '.join('%s:%d' % item for item in sorted(blamed.items()))}
+        self.blocks.append(summary)
+        self.block = None
+        return summary
+
+    def write_summary(self, path):
+        """Writes the block summaries to a csv table."""
+        with open(path, 'w') as out:
+            writer = csv.DictWriter(out, fieldnames=BLOCK_FIELDS, lineterminator='\n')
+            writer.writeheader()
+            writer.writerows(self.blocks)
+        return path
@@ -0,0 +1,161 @@
+"""
+Round-trip latency and throughput harness for the PsychoPy -> NetStation link.
+
+run_link sends n events through a connected Netstation client at a target rate (events per second,
+0 = as fast as possible), with a label of `payload` characters and, optionally, a key table carrying
+another `payload` characters. For every event it records, in preallocated arrays:
+    - send: time the caller spends in the send call (ms)
+    - rtt:  time from the send call until NetStation acknowledged the event ('Z') (ms)
+mode='direct' calls ns.send_event on the caller thread, so send == rtt; mode='async' goes through
+pyns_send.AsyncSender, where send is the cost left on the frame loop and rtt includes the queueing.
+summarize reports p50/p95/p99/max of both and the events per second acknowledged.
+
+Without a host, run_grid starts a local pyns_eci.EciServer stand-in. The client is egi.simple.Netstation
+if it can be imported, otherwise pyns_eci.EciClient (same wire format).
+
+Example:
+    python pyns_link.py                                   # local stand-in, default grid
+    python pyns_link.py --host 10.0.0.42 --events 2000 --rates 0,100,500 --payloads 0,64,256 --mode async
+"""
+from __future__ import division, print_function
+import sys
+import time
+from timeit import default_timer
+import numpy as np
+
+PERCENTILES = (50, 95, 99)
+LINK_EVENTS = 1000
+LINK_RATES = (0, 100, 500)
+LINK_PAYLOADS = (0, 64, 255)
+
+
+def netstation_client():
+    """egi.simple.Netstation if available, else the pyns_eci.EciClient stand-in client."""
+    try:
+        import egi.simple as egi
+        return egi.Netstation()
+    except Exception:
+        from pyns_eci import EciClient
+        return EciClient()
+
+
+class AckTimes(object):
+    """Proxy of a Netstation client writing the acknowledgement time of the k-th send_event into acked[k]."""
+    def __init__(self, ns, acked):
+        self.ns = ns
+        self.acked = acked
+        self.count = 0
+
+    def send_event(self, *args, **kwargs):
+        result = self.ns.send_event(*args, **kwargs)
+        self.acked[self.count] = default_timer()
+        self.count += 1
+        return result
+
+    def __getattr__(self, name):
+        return getattr(self.ns, name)
+
+
+def run_link(ns, n_events=LINK_EVENTS, rate=0, payload=0, table=False, mode='direct'):
+    """
+    Syntax: run_link(connected Netstation client (session begun), n_events, rate=events/s or 0, payload=chars,
+                     table=False, mode='direct' or 'async')
+
+    Sends n_events 'lnk_' events; returns (send ms per event, rtt ms per event (nan if never acknowledged), total s).
+    """
+    called = np.empty(n_events)
+    returned = np.empty(n_events)
+    acked = np.empty(n_events)
+    label = 'x' * min(payload, 255)
+    tables = [{'indx': i, 'data': 'y' * payload} if table else None for i in range(n_events)]
+    client = AckTimes(ns, acked)
+    sender = None
+    if mode == 'async':
+        from pyns_send import AsyncSender, local_ms
+        sender = AsyncSender(client, local_ms).start()
+        send = sender.send
+    elif mode == 'direct':
+        send = client.send_event
+    else:
+        raise ValueError("mode must be 'direct' or 'async'")
+    ns.sync()
+    period = 1.0 / rate if rate else 0.0
+    start = default_timer()
+    for i in range(n_events):
+        if period:
+            #sleep most of the way, then spin for the last ms so the pacing does not drift
+            due = start + i * period
+            while True:
+                left = due - default_timer()
+                if left <= 0:
+                    break
+                if left > 0.002:
+                    time.sleep(left - 0.001)
+        called[i] = default_timer()
+        send('lnk_', label=label, table=tables[i])
+        returned[i] = default_timer()
+    if sender is not None:
+        sender.close()
+    total = (acked[client.count - 1] if client.count else returned[-1]) - start
+    send_ms = (returned - called) * 1000
+    rtt_ms = (acked - called) * 1000
+    if client.count < n_events:
+        rtt_ms[client.count:] = np.nan
+    return send_ms, rtt_ms, total
+
+
+def summarize(send_ms, rtt_ms, total):
+    """p50/p95/p99/max of the send and rtt latencies (ms) and the acknowledged events per second."""
+    summary = {}
+    for name, values in (('send', send_ms), ('rtt', rtt_ms)):
+        values = values[~np.isnan(values)]
+        for p, value in zip(PERCENTILES, np.percentile(values, PERCENTILES) if len(values) else [np.nan] * 3):
+            summary['%s_p%d' % (name, p)] = round(float(value), 3)
+        summary[name + '_max'] = round(float(values.max()), 3) if len(values) else np.nan
+    summary['events_per_s'] = round(np.count_nonzero(~np.isnan(rtt_ms)) / total, 1) if total > 0 else np.nan
+    return summary
+
+
+def run_grid(host=None, port=None, n_events=LINK_EVENTS, rates=LINK_RATES, payloads=LINK_PAYLOADS, mode='direct'):
+    """
+    Syntax: run_grid(host=None (local stand-in), port=55513, n_events=1000, rates=(0,100,500), payloads=(0,64,255))
+
+    run_link for every rate x payload, without and with a key table, on one session.
+    Returns a list of (rate, payload, table, summary dict).
+    """
+    server = None
+    if host is None:
+        from pyns_eci import EciServer
+        server = EciServer().start()
+        host, port = server.host, server.port
+    ns = netstation_client()
+    ns.connect(host, port or 55513)
+    results = []
+    try:
+        ns.BeginSession()
+        for rate in rates:
+            for payload in payloads:
+                for table in (False, True):
+                    results.append((rate, payload, table, summarize(*run_link(ns, n_events, rate, payload, table, mode))))
+        ns.EndSession()
+    finally:
+        ns.disconnect()
+        if server is not None:
+            server.stop()
+    return results
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    options = dict((args[i], args[i + 1]) for i in range(len(args) - 1) if args[i].startswith('--'))
+    results = run_grid(options.get('--host'), int(options['--port']) if '--port' in options else None,
+                       int(options.get('--events', LINK_EVENTS)),
+                       [int(rate) for rate in options['--rates'].split(',')] if '--rates' in options else LINK_RATES,
+                       [int(size) for size in options['--payloads'].split(',')] if '--payloads' in options else LINK_PAYLOADS,
+                       options.get('--mode', 'direct'))
+    print('%6s | %7s | %5s | %8s %8s %8s %8s | %8s %8s %8s %8s | %8s' % ('rate', 'payload', 'table', 'send p50',
+          'p95', 'p99', 'max', 'rtt p50', 'p95', 'p99', 'max', 'events/s'))
+    for rate, payload, table, s in results:
+        print('%6s | %7d | %5s | %8.3f %8.3f %8.3f %8.3f | %8.3f %8.3f %8.3f %8.3f | %8.1f' % (rate or 'max', payload,
+              table, s['send_p50'], s['send_p95'], s['send_p99'], s['send_max'], s['rtt_p50'], s['rtt_p95'],
+              s['rtt_p99'], s['rtt_max'], s['events_per_s']))
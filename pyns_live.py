@@ -0,0 +1,252 @@
+"""
+Live tail mode: PY-NS timing statistics while the session is still running.
+
+follow() tails the growing PsychoPy .log (and the NetStation event export, once it exists)
+from the last byte offset read, so every poll only parses the newly appended lines.
+Events of the requested tags are paired between both logs by code and time: until the first pair
+pyns_match.match_events seeds the PY-NS offset on the (bounded) queues of events not paired yet, then every
+new event is only looked up in the other log's queue, within tol ms of the running offset.
+DriftMonitor keeps running timediff/average_diff statistics of the pairs:
+	- interval diff: (py interval) - (ns interval) of consecutive paired events, as in average_diff
+	- drift: (py time since first pair) - (ns time since first pair)
+A WARNING is printed for every pair whose interval diff goes beyond the threshold (default 15 ms, as in
+pyns_core), and once when the drift crosses it (again only after it came back below half the threshold).
+Without an NS export only running PsychoPy interval statistics are kept.
+An event whose counterpart should have arrived already (the other log is more than MATCH_TOL ms past it)
+is counted as unmatched instead of being paired with the next event of the other log.
+
+Example: follow('data/eog_blinks_001/eog_blinks_001', 'data/eog_blinks_001/nslog', 'sbl', 'scl', 'sop')
+"""
+from __future__ import division, print_function
+import os
+import time
+from collections import deque
+import pyns_core as pyns
+from pyns_match import match_events, MATCH_TOL
+
+#seconds between two reads of the logs
+POLL_INTERVAL=0.25
+DRIFT_THRESHOLD=15
+#events kept waiting for a counterpart before the first pair (no offset to expire them by yet)
+PENDING_LIMIT=256
+
+
+class LogTail(object):
+	"""
+	Syntax: LogTail('string of file name')
+
+	Reads the complete lines appended to a file since the previous read.
+	A trailing partial line is kept until its newline arrives; a truncated/replaced file is read again from the start.
+	"""
+	def __init__(self,path):
+		self.path=str(path)
+		self.offset=0
+		self.partial=b''
+
+	def read(self):
+		"""Returns the list of new complete lines (bytes), [] if the file does not exist (yet)."""
+		try:
+			size=os.path.getsize(self.path)
+		except OSError:
+			return []
+		if size < self.offset:
+			self.offset,self.partial=0,b''
+		if size == self.offset:
+			return []
+		with open(self.path,'rb') as logFile:
+			logFile.seek(self.offset)
+			chunk=logFile.read(size-self.offset)
+		self.offset+=len(chunk)
+		lines=(self.partial+chunk).split(b'\n')
+		self.partial=lines.pop()
+		return lines
+
+
+def ns_event(line):
+	"""(code, onset ms) of a raw NetStation export line, None for header lines."""
+	fields=line.rstrip(b'\r').split(b'\t')
+	if len(fields) < 6 or len(fields[4]) != pyns.NS_TIME_WIDTH:
+		return None
+	try:
+		return fields[0].decode('utf-8','replace'),int(pyns.parse_nstime([fields[4]])[0])
+	except ValueError:
+		return None
+
+
+class DriftMonitor(object):
+	"""
+	Syntax: DriftMonitor(threshold=15, tol=100, ns=True)
+
+	Pairs PsychoPy and NetStation events by code (first three letters) within tol ms of the running offset,
+	and keeps running statistics (count, mean/max absolute interval diff, current drift, unmatched events).
+	With ns=False (no NS export) PsychoPy events are only counted into the interval statistics.
+	"""
+	def __init__(self,threshold=DRIFT_THRESHOLD,tol=MATCH_TOL,ns=True):
+		self.threshold=threshold
+		self.tol=tol
+		self.ns=ns
+		self.py_events=0
+		self.py_last=None
+		self.py_mean_interval=0.0
+		self.py_max_interval=0.0
+		self.offset=None
+		self.latest_py=None
+		self.latest_ns=None
+		self.unmatched_py=0
+		self.unmatched_ns=0
+		self.pending_py=deque()
+		self.pending_ns=deque()
+		self.first=None
+		self.last=None
+		self.pairs=0
+		self.mean_diff=0.0
+		self.max_diff=0.0
+		self.drift=0.0
+		self.drifting=False
+		self.flags=[]
+
+	def add_py(self,onset,tag):
+		if self.py_last is not None:
+			interval=onset-self.py_last
+			self.py_mean_interval+=(interval-self.py_mean_interval)/self.py_events
+			self.py_max_interval=max(self.py_max_interval,interval)
+		self.py_last=onset
+		self.py_events+=1
+		if not self.ns:
+			return
+		self.latest_py=onset if self.latest_py is None else max(self.latest_py,onset)
+		if self.offset is None:
+			self.pending_py.append((onset,tag))
+			self.seed()
+		else:
+			ns_onset=self.take(self.pending_ns,tag,onset+self.offset)
+			if ns_onset is None:
+				self.pending_py.append((onset,tag))
+			else:
+				self.pair(onset,ns_onset,tag)
+		self.expire()
+
+	def add_ns(self,onset,tag):
+		self.latest_ns=onset if self.latest_ns is None else max(self.latest_ns,onset)
+		if self.offset is None:
+			self.pending_ns.append((onset,tag))
+			self.seed()
+		else:
+			py_onset=self.take(self.pending_py,tag,onset-self.offset)
+			if py_onset is None:
+				self.pending_ns.append((onset,tag))
+			else:
+				self.pair(py_onset,onset,tag)
+		self.expire()
+
+	def take(self,pending,tag,expected):
+		"""
+		Removes from pending (time ordered (onset, tag) queue of the other log) and returns the onset of the event
+		of the same code closest to expected (onset in that log's clock) within tol ms; None if there is none.
+		"""
+		best=None
+		for i,(onset,other) in enumerate(pending):
+			if onset > expected+self.tol:
+				break
+			if other[0:3] == tag[0:3] and abs(onset-expected) <= self.tol and (best is None or abs(onset-expected) < abs(pending[best][0]-expected)):
+				best=i
+		if best is None:
+			return None
+		onset=pending[best][0]
+		del pending[best]
+		return onset
+
+	def seed(self):
+		"""Before the first pair: pairs the pending events (at most PENDING_LIMIT per log) with match_events."""
+		if self.pending_py and self.pending_ns:
+			py,ns=list(self.pending_py),list(self.pending_ns)
+			found=match_events([tag[0:3] for onset,tag in py],[onset for onset,tag in py],
+				[tag[0:3] for onset,tag in ns],[onset for onset,tag in ns],tol=self.tol)
+			for i,k in zip(found.py,found.ns):
+				self.pair(py[i][0],ns[k][0],py[i][1])
+			self.pending_py=deque(py[i] for i in found.unmatched_py)
+			self.pending_ns=deque(ns[k] for k in found.unmatched_ns)
+
+	def expire(self):
+		"""Counts as unmatched the pending events the other log has moved more than tol ms past."""
+		if self.offset is None:
+			while len(self.pending_py) > PENDING_LIMIT:
+				self.pending_py.popleft()
+				self.unmatched_py+=1
+			while len(self.pending_ns) > PENDING_LIMIT:
+				self.pending_ns.popleft()
+				self.unmatched_ns+=1
+			return
+		while self.pending_py and self.latest_ns is not None and self.pending_py[0][0]+self.offset < self.latest_ns-self.tol:
+			self.pending_py.popleft()
+			self.unmatched_py+=1
+		while self.pending_ns and self.latest_py is not None and self.pending_ns[0][0]-self.offset < self.latest_py-self.tol:
+			self.pending_ns.popleft()
+			self.unmatched_ns+=1
+
+	def pair(self,py_onset,ns_onset,tag):
+		self.offset=ns_onset-py_onset
+		if self.first is None:
+			self.first=self.last=(py_onset,ns_onset)
+			return
+		diff=abs((py_onset-self.last[0])-(ns_onset-self.last[1]))
+		self.drift=(py_onset-self.first[0])-(ns_onset-self.first[1])
+		self.last=(py_onset,ns_onset)
+		self.pairs+=1
+		self.mean_diff+=(diff-self.mean_diff)/self.pairs
+		self.max_diff=max(self.max_diff,diff)
+		#drift warns once per crossing; re-armed below half the threshold so jitter around it does not re-warn
+		crossed=abs(self.drift) >= self.threshold and not self.drifting
+		if diff >= self.threshold or crossed:
+			self.flag(tag,diff)
+		if crossed:
+			self.drifting=True
+		elif abs(self.drift) < self.threshold/2:
+			self.drifting=False
+
+	def flag(self,tag,diff):
+		self.flags.append((self.pairs,tag,diff,self.drift))
+		print("WARNING: big diff at PY-NS timing: pair# " + str(self.pairs) + " (" + tag + "): " + str(round(diff,2)) +
+			" ms, drift " + str(round(self.drift,2)) + " ms (above " + str(self.threshold) + "ms)")
+
+	def summary(self):
+		"""Running statistics as a dict."""
+		py={'py_events':self.py_events,'py_avg_interval':round(self.py_mean_interval,2),'py_max_interval':round(self.py_max_interval,2)}
+		if not self.ns:
+			return py
+		return dict(py,**{'pairs':self.pairs,'avg_diff':round(self.mean_diff,2),'max_diff':round(self.max_diff,2),
+			'drift':round(self.drift,2),'pending_py':len(self.pending_py),'pending_ns':len(self.pending_ns),
+			'unmatched_py':self.unmatched_py,'unmatched_ns':self.unmatched_ns,'flags':len(self.flags)})
+
+
+def follow(pylog,nslog=None,*event_tags,**kwargs):
+	"""
+	Syntax: follow(string of PsychoPy log w/o extension, string of NS event export or None, 'event tags', threshold=15, poll=0.25, duration=None)
+	Example: follow('test2','test1','sbl','scl','sop')
+
+	Tails both logs every poll seconds until duration seconds passed (None: until Ctrl+C),
+	feeding events of event_tags (first three letters, as in filter_pyevent) to a DriftMonitor.
+	Without an NS export only the PsychoPy side is read (interval statistics only). Returns the DriftMonitor.
+	"""
+	monitor=DriftMonitor(kwargs.get('threshold',DRIFT_THRESHOLD),ns=bool(nslog))
+	poll=kwargs.get('poll',POLL_INTERVAL)
+	duration=kwargs.get('duration')
+	tags=set(str(event) for event in event_tags)
+	py_tail=LogTail(str(pylog) + '.log')
+	ns_tail=LogTail(nslog) if nslog else None
+	start=time.time()
+	try:
+		while duration is None or time.time()-start < duration:
+			for line in py_tail.read():
+				row=pyns.parse_pyline(line)
+				if row is not None and row[1][0:3] in tags:
+					monitor.add_py(row[0],row[1].split(' | ')[0])
+			if ns_tail is not None:
+				for line in ns_tail.read():
+					row=ns_event(line)
+					if row is not None and row[0][0:3] in tags:
+						monitor.add_ns(row[1],row[0])
+			time.sleep(poll)
+	except KeyboardInterrupt:
+		pass
+	return monitor
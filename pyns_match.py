@@ -0,0 +1,103 @@
+"""
+Event matching between PsychoPy and NetStation logs whose event counts differ.
+
+average_diff needs both logs to hold exactly the same events; one extra 'sync' row or trailing
+DIN3 makes it give up. match_events aligns the two tag sequences by code and approximate time:
+	- the clock offset (ns - py) is seeded from the most common difference of same-code events among
+	  the first SEED_EVENTS events of each log
+	- each PsychoPy event is then matched to the closest unmatched same-code NetStation event within
+	  `tol` ms of its expected time (py onset + running offset), looked up by bisection with `band`
+	  extra rows scanned on each side, as NS rows may be slightly out of order
+	- the running offset is updated on every match, so the window follows the clock drift; no NS event
+	  is given up because of the seed, unmatched ones stay available for later PsychoPy events
+Work is O(N * (log N + band)). Events left over on either side are returned as unmatched.
+
+Example:
+	py = filter_pyevent(filter_pylog('test2','data'),'sbl','scl','sop')
+	ns = filter_nsevent(filter_nslog('test1'),'sbl','scl','sop')
+	match = match_tables(py, ns)
+	diff_py, diff_ns = timediff_py(py.take(match.py)), timediff_ns(ns.take(match.ns))
+"""
+from __future__ import division
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+import numpy as np
+from pyns_profile import stage
+
+#max distance (ms) between an NS onset and its expected time (py onset + offset)
+MATCH_TOL=100.0
+#number of NS events searched on each side of the expected time (NS rows may be out of order)
+MATCH_BAND=8
+#events of each log the initial offset is estimated from
+SEED_EVENTS=64
+
+EventMatch=namedtuple('EventMatch',['py','ns','unmatched_py','unmatched_ns'])
+
+
+def estimate_offset(py_code,py_onset,ns_code,ns_onset,band=MATCH_BAND,tol=MATCH_TOL):
+	"""Most common ns - py onset difference (binned by tol) of same-code events within band positions."""
+	diffs=[]
+	for shift in range(-band,band+1):
+		i=np.arange(max(0,-shift),min(len(py_code),len(ns_code)-shift))
+		same=py_code[i] == ns_code[i+shift]
+		diffs.append(ns_onset[i[same]+shift]-py_onset[i[same]])
+	diffs=np.concatenate(diffs)
+	if len(diffs) == 0:
+		return 0.0
+	bins,counts=np.unique(np.round(diffs/tol),return_counts=True)
+	best=bins[np.argmax(counts)]
+	return float(np.median(diffs[np.round(diffs/tol) == best]))
+
+
+def match_events(py_code,py_onset,ns_code,ns_onset,band=MATCH_BAND,tol=MATCH_TOL,offset=None):
+	"""
+	Syntax: match_events(py codes, py onsets ms, ns codes, ns onsets ms, band=8, tol=100, offset=None)
+
+	Windowed alignment of two time-ordered event sequences (see module docstring).
+	Codes can be any comparable values (ie. three letter prefixes).
+	offset: ns - py offset (ms) already known (ie. from earlier matches), used instead of the seed estimate.
+	Returns EventMatch(py, ns, unmatched_py, unmatched_ns) index arrays; py[k] is matched with ns[k].
+	"""
+	py_code=np.asarray(py_code)
+	ns_code=np.asarray(ns_code)
+	py_onset=np.asarray(py_onset,dtype=np.float64)
+	ns_onset=np.asarray(ns_onset,dtype=np.float64)
+	if offset is None:
+		offset=estimate_offset(py_code[:SEED_EVENTS],py_onset[:SEED_EVENTS],ns_code[:SEED_EVENTS],ns_onset[:SEED_EVENTS],band,tol)
+	#plain lists: the pass below indexes single elements, which is much faster than on arrays
+	py_codes,py_times=py_code.tolist(),py_onset.tolist()
+	ns_codes,ns_times=ns_code.tolist(),ns_onset.tolist()
+	n_ns=len(ns_codes)
+	py_match,ns_match=[],[]
+	used=[False]*n_ns
+	for i in range(len(py_codes)):
+		expected=py_times[i]+offset
+		#NS events inside the window, give or take band rows out of order
+		first=bisect_left(ns_times,expected-tol)
+		last=bisect_right(ns_times,expected+tol,first)
+		best,best_gap=None,tol
+		for k in range(max(0,first-band),min(last+band,n_ns)):
+			gap=abs(ns_times[k]-expected)
+			if not used[k] and ns_codes[k] == py_codes[i] and gap <= best_gap:
+				best,best_gap=k,gap
+		if best is not None:
+			py_match.append(i)
+			ns_match.append(best)
+			used[best]=True
+			offset=ns_times[best]-py_times[i]
+	py_match=np.array(py_match,dtype=np.intp)
+	ns_match=np.array(ns_match,dtype=np.intp)
+	return EventMatch(py_match,ns_match,
+		np.setdiff1d(np.arange(len(py_code)),py_match),np.setdiff1d(np.arange(len(ns_code)),ns_match))
+
+
+@stage('match_tables')
+def match_tables(py_table,ns_table,band=MATCH_BAND,tol=MATCH_TOL):
+	"""
+	Syntax: match_tables(EventTable of PsychoPy events, EventTable of NetStation events)
+
+	match_events on two EventTables, comparing the three letter prefixes used by filter_*event.
+	"""
+	py_code=np.array(py_table.prefixes,dtype=object)[py_table.prefix_code] if len(py_table) else np.array([],dtype=object)
+	ns_code=np.array(ns_table.prefixes,dtype=object)[ns_table.prefix_code] if len(ns_table) else np.array([],dtype=object)
+	return match_events(py_code,py_table.onset,ns_code,ns_table.onset,band,tol)
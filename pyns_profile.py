@@ -0,0 +1,107 @@
+"""
+Opt-in stage profiling of the pyns_core pipeline and the pyns_run entry points.
+
+Stages are marked with the @stage decorator. While profiling is enabled every call records
+its wall time, rows in (length of the first argument), rows out (length of the result) and,
+for readers, bytes read (size of the log file). Disabled (the default), a stage costs one
+flag check per call.
+
+Enable with enable() or by setting the PYNS_PROFILE environment variable before importing pyns_core.
+
+Example:
+	import pyns_profile
+	pyns_profile.enable()
+	pyns_diff('example_pylog','example_nslog','data','sbl','scl','sop')
+	print(pyns_profile.report()['totals'])
+	pyns_profile.write_json('profile.json')
+"""
+from __future__ import division
+import functools
+import json
+import os
+import time
+
+ENABLED=bool(os.environ.get('PYNS_PROFILE'))
+RECORDS=[]
+_depth=[0]
+
+
+def enable():
+	"""Turns stage recording on (records are kept until reset())."""
+	global ENABLED
+	ENABLED=True
+
+
+def disable():
+	"""Turns stage recording off."""
+	global ENABLED
+	ENABLED=False
+
+
+def reset():
+	"""Forgets every recorded stage."""
+	del RECORDS[:]
+
+
+def count_rows(value):
+	"""len(value) for tables/lists/arrays (first field of namedtuples), None for anything else (ie. file names)."""
+	if isinstance(value,(str,bytes,type(u''))):
+		return None
+	if isinstance(value,tuple) and hasattr(value,'_fields'):
+		value=value[0]
+	try:
+		return len(value)
+	except TypeError:
+		return None
+
+
+def stage(name,source=None):
+	"""
+	Syntax: @stage('stage name', source=function(args, kwargs) --> path of the file read, or None)
+
+	Decorator recording one entry per call while profiling is enabled.
+	"""
+	def wrap(function):
+		@functools.wraps(function)
+		def timed(*args,**kwargs):
+			if not ENABLED:
+				return function(*args,**kwargs)
+			record={'stage':name,'depth':_depth[0],'rows_in':count_rows(args[0]) if args else None}
+			if source is not None:
+				try:
+					record['bytes_read']=os.path.getsize(source(args,kwargs))
+				except (OSError,TypeError):
+					record['bytes_read']=None
+			_depth[0]+=1
+			start=time.time()
+			try:
+				result=function(*args,**kwargs)
+			finally:
+				_depth[0]-=1
+				record['ms']=round((time.time()-start)*1000,3)
+				RECORDS.append(record)
+			record['rows_out']=count_rows(result)
+			return result
+		return timed
+	return wrap
+
+
+def report():
+	"""
+	Structured report of the recorded stages:
+	{'stages': [one dict per call, in completion order], 'totals': {stage: {'calls', 'ms', 'rows_in', 'rows_out', 'bytes_read'}}}
+	"""
+	totals={}
+	for record in RECORDS:
+		total=totals.setdefault(record['stage'],{'calls':0,'ms':0.0,'rows_in':0,'rows_out':0,'bytes_read':0})
+		total['calls']+=1
+		total['ms']=round(total['ms']+record['ms'],3)
+		for key in ('rows_in','rows_out','bytes_read'):
+			total[key]+=record.get(key) or 0
+	return {'stages':list(RECORDS),'totals':totals}
+
+
+def write_json(path):
+	"""Writes report() to path as json."""
+	with open(path,'w') as out:
+		json.dump(report(),out,indent=1,sort_keys=True)
@@ -6,17 +6,21 @@ See function help for details of each argument ie. help(pyns_diff)
 Basic syntax:
 Example1 = pyns_diff('test2','test1','data','int','ope','clo','gaz','end')
 Example2 = pyns_pc('test2','test1','wsq','ope','clo','gaz')
-"""
-from text_to_csv import text_to_csv
-print('Imported text_to_csv')
-import pyns_core as pyns
-print('Imported pyns_core \n')
-
-print("QUICK GUIDE: \n 1. pyns_diff: for measuring PY-NS timing \n 2. pyns_pc: for measuring photocell timing\n")
-print("SYNTAX: pyns_diff(string of PsychoPy log, string of NS log, 'data', 'custom event tags seperated by comma')")
-print("SYNTAX: pyns_pc  (string of PsychoPy log, string of NS log, 'photocell tag', 'custom event tags seperated by comma')")
-print("TYPE: 'help(pyns_run)' or 'help(pyns_pc)' for detail")
 
+Set PYNS_PROFILE=1 (or call pyns_profile.enable()) to record per stage timings, see pyns_profile.report()
+"""
+from __future__ import print_function
+from pyns_session import open_session
+from pyns_profile import stage
+
+QUICK_GUIDE=(
+	"QUICK GUIDE: \n 1. pyns_diff: for measuring PY-NS timing \n 2. pyns_pc: for measuring photocell timing\n\n"
+	"SYNTAX: pyns_diff(string of PsychoPy log, string of NS log, 'data', 'custom event tags seperated by comma')\n"
+	"SYNTAX: pyns_pc  (string of PsychoPy log, string of NS log, 'photocell tag', 'custom event tags seperated by comma')\n"
+	"TYPE: 'help(pyns_run)' or 'help(pyns_pc)' for detail\n"
+	"COMMAND LINE: python -m pyns diff|pc|batch --help")
+
+@stage('pyns_diff')
 def pyns_diff(pylog, nslog, filter_py='data', *event_tags):
 	"""
 	Compiles all the functions from pyns_core.py to compare PsychoPy and NetStation logs.
@@ -30,25 +34,19 @@ def pyns_diff(pylog, nslog, filter_py='data', *event_tags):
 			   'data' should be used unless specific change in experiment code
 	*event_tags: list all custom label tags in strings separated each by comma
 	"""
-	#convert log text files to readable csv files
-	text_to_csv(str(nslog),str(pylog))
-
-	#PsychoPy processing: filter_pylog -> filter_pyevent -> timediff_py
-	filtered_pylog   = pyns.filter_pylog(str(pylog),str(filter_py))
-	filtered_pyevent = pyns.filter_pyevent(filtered_pylog,*event_tags)
-	diff_py          = pyns.timediff_py(filtered_pyevent)
-
-	print('PsychoPy timing differences: ' + str(diff_py))
-
-	#NetStation processing: filter_nslog -> filter_nsevent -> timediff_ns
-	filtered_nslog   = pyns.filter_nslog(str(nslog))
-	filtered_nsevent = pyns.filter_nsevent(filtered_nslog,*event_tags)
-	diff_ns          = pyns.timediff_ns(filtered_nsevent)
-
-	print('NetStation timing differences: ' + str(diff_ns))
-
-	avg=pyns.average_diff(diff_py,diff_ns)
-	print "Average Psychopy-Netstation: " + str(avg) + " ms"
+	#each log is parsed once per session and shared with pyns_pc
+	#filter_pylog -> filter_pyevent -> timediff_py / filter_nslog -> filter_nsevent -> timediff_ns,
+	#on matched events only if the logs hold a different number of events
+	session=open_session(pylog,nslog)
+	diff_py, diff_ns, avg = session.diff(filter_py,*event_tags)
+	fit=session.clock(filter_py,*event_tags)
+
+	print('PsychoPy timing differences: ' + str(diff_py.tolist()))
+	print('NetStation timing differences: ' + str(diff_ns.tolist()))
+
+	print("Average Psychopy-Netstation: " + str(avg) + " ms")
+	print("Clock fit: offset " + str(fit['offset']) + " ms, drift " + str(fit['drift_ppm']) + " ppm, residual " +
+		str(fit['residual_scale']) + " ms (max " + str(fit['residual_max']) + " ms)")
 	return avg
 
 # For running test1, test2 files:
@@ -56,6 +54,7 @@ def pyns_diff(pylog, nslog, filter_py='data', *event_tags):
 
 
 ### Photocell Timing ###
+@stage('pyns_pc')
 def pyns_pc(pylog, nslog, pypc_tag='wsq', *event_tags):
 	"""
 	Compiles PsychoPy's and NetSTation's photocell functions and print out each timing
@@ -70,11 +69,14 @@ def pyns_pc(pylog, nslog, pypc_tag='wsq', *event_tags):
 		   'wsq' is used for basic run task
 		   *event_tags: list all custom label tags in strings separated each by comma
 	"""
-	filtered_pypc    = pyns.photocell_py(str(pylog),pypc_tag,*event_tags)
-	filtered_nspc    = pyns.photocell_ns(str(nslog),*event_tags)
+	filtered_pypc, filtered_nspc = open_session(pylog,nslog).pc(pypc_tag,*event_tags)
 	print('Average PsychoPy photocell timing diff: ' + str(filtered_pypc) + ' ms')
 	print('Average NetStation photocell timing diff: ' + str(filtered_nspc) + ' ms')
 	return filtered_pypc, filtered_nspc
 
 # For running test1, test2 files:
 # example2 = pyns_pc('example_pylog', 'example_nslog', 'wsq', 'sbl','scl','sop','sle','sri','s_u','sdo')
+
+
+if __name__ == '__main__':
+	print(QUICK_GUIDE)
@@ -0,0 +1,115 @@
+"""
+Non-slip cue schedule for pyns_exp.py.
+
+core.wait(isi / 2) around show_screen(), play() and send_to_NS() makes every trial last isi plus the time
+those calls take, so the error adds up over the whole session. session_plan computes, before the first block,
+the absolute time (s from the session start) of every blank screen, cross display and cue; CueScheduler
+then waits for each target on a monotonic clock (sleeps until SPIN_MARGIN before it, busy-waits the rest)
+and records the scheduled vs actual time of each step. A late step never delays the following ones, and
+pauses shift the remaining schedule as a whole (shift()).
+
+Example:
+    plan = session_plan([('blink', 2, ['blik'] * 4), ('gaze', 1.5, ['left', 'uupp'])], dur_blank=0.5)
+    timer = CueScheduler().start()
+    for target, block, kind, key in plan:
+        actual = timer.wait_until(target)
+        ...                                         # show the crosses / play the cue
+        timer.record(block, kind, key, target, actual)
+    print(timer.summary())                          # cue errors (ms): mean, p95, max, last
+    timer.write(filename + '_timing.csv')
+"""
+from __future__ import division
+import csv
+import time
+from timeit import default_timer
+import numpy as np
+
+BLANK = 'blank'
+SHOW = 'show'
+CUE = 'cue'
+END = 'end'
+# s before the target at which the sleep stops and the busy-wait takes over
+SPIN_MARGIN = 0.002
+TIMING_FIELDS = ['block', 'kind', 'key', 'target_s', 'actual_s', 'error_ms']
+
+
+def session_plan(blocks, dur_blank):
+    """
+    Syntax: session_plan([(block name, isi in s, [cue codes])...], dur_blank in s)
+
+    Returns [(target s, block index, kind, code)] in time order: each block starts with dur_blank s of blank
+    screen (BLANK, code = block name); each trial shows the crosses (SHOW) at its start and plays its cue (CUE)
+    isi / 2 later, the next trial starting isi after the previous one. A last (END) entry marks the end of the
+    last trial.
+    """
+    plan = []
+    target = 0.0
+    for index, (name, isi, codes) in enumerate(blocks):
+        plan.append((target, index, BLANK, name))
+        target += dur_blank
+        for code in codes:
+            plan.append((target, index, SHOW, name))
+            plan.append((target + isi / 2, index, CUE, code))
+            target += isi
+    plan.append((target, len(blocks), END, None))
+    return plan
+
+
+class CueScheduler(object):
+    """
+    Syntax: CueScheduler(clock=timeit.default_timer (monotonic, s), spin=0.002)
+
+    Waits for absolute targets (s from start()) and keeps the scheduled vs actual time of each recorded step.
+    """
+    def __init__(self, clock=default_timer, spin=SPIN_MARGIN):
+        self.clock = clock
+        self.spin = spin
+        self.origin = None
+        self.paused = 0.0
+        self.rows = []
+
+    def start(self):
+        """Sets time 0 of the schedule to now; returns the scheduler."""
+        self.origin = self.clock()
+        return self
+
+    def now(self):
+        """s since start() (pauses excluded)."""
+        return self.clock() - self.origin
+
+    def shift(self, seconds):
+        """Delays the rest of the schedule by seconds (ie. the time spent paused)."""
+        self.origin += seconds
+        self.paused += seconds
+
+    def wait_until(self, target):
+        """Sleeps, then busy-waits, until target s; returns the actual time (s), later than target if already past."""
+        left = target - self.now()
+        if left > self.spin:
+            time.sleep(left - self.spin)
+        now = self.now()
+        while now < target:
+            now = self.now()
+        return now
+
+    def record(self, block, kind, code, target, actual):
+        """Keeps one scheduled vs actual row."""
+        self.rows.append({'block': block, 'kind': kind, 'key': code, 'target_s': round(target, 6),
+                          'actual_s': round(actual, 6), 'error_ms': round((actual - target) * 1000, 3)})
+
+    def summary(self, kind=CUE):
+        """Dict of the errors (ms) of the recorded steps of kind: count, mean, p95, max and last (session drift)."""
+        errors = np.array([row['error_ms'] for row in self.rows if row['kind'] == kind])
+        if not len(errors):
+            return {'count': 0, 'paused_s': round(self.paused, 3)}
+        return {'count': len(errors), 'mean_ms': round(float(errors.mean()), 3),
+                'p95_ms': round(float(np.percentile(errors, 95)), 3), 'max_ms': round(float(errors.max()), 3),
+                'last_ms': float(errors[-1]), 'paused_s': round(self.paused, 3)}
+
+    def write(self, path):
+        """Writes the recorded rows to a csv table."""
+        with open(path, 'w') as out:
+            writer = csv.DictWriter(out, fieldnames=TIMING_FIELDS, lineterminator='\n')
+            writer.writeheader()
+            writer.writerows(self.rows)
+        return path
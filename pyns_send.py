@@ -0,0 +1,225 @@
+"""
+Non-blocking NetStation event sender for the experiment scripts.
+
+ns.sync() + ns.send_event() on the frame loop cost one or two TCP round-trips to NetStation
+per event, which easily eats into the 16.7 ms frame budget. AsyncSender moves them off the frame loop:
+    - send() stamps the event with the local time at the call site (egi.ms_localtime) and appends it
+      to a deque (append/popleft are atomic, no lock is taken by the caller)
+    - a daemon thread owns the Netstation socket once started: it drains the deque and sends each
+      event with its call site timestamp, so network delays no longer shift the event onset
+    - NetStation commands that must stay in order with the events (ie. StopRecording) go through call()
+    - with log=pyns_evlog.EventLog, every event sent is recorded with its frame, flip time and the ms from
+      send() to the NetStation acknowledgement
+
+SyncScheduler replaces the ns.sync() before every event: the clocks are resynchronized only when the last
+sync is older than `interval` seconds, or during idle periods (blank/ITI screens, see idle()) once it is older
+than `idle_age`. Between syncs it bounds how far off the NetStation alignment can be: half the round-trip of the
+last sync (NetStation takes the local timestamp when the 'T' command arrives, somewhere within the round-trip)
+plus the worst case clock drift since that sync. ns.sync() returns no offset, so none is estimated here.
+
+Example:
+    ns = egi.Netstation()
+    ns.connect('10.0.0.42', 55513)
+    ns.BeginSession()
+    sender = AsyncSender(ns)
+    sender.start()
+    sender.send('sbli')              # returns in microseconds
+    sender.idle()                    # on a blank screen: resync now if the last sync is getting old
+    print(sender.scheduler.metrics())
+    sender.call('StopRecording')
+    sender.close()                   # sends what is left, then stops the thread
+"""
+from __future__ import print_function
+import collections
+import threading
+import time
+from timeit import default_timer
+
+# seconds the sender thread sleeps when idle before checking the queue again
+IDLE_WAIT = 0.05
+# seconds close() waits for the queue to drain
+CLOSE_TIMEOUT = 5.0
+# seconds after which the next event resynchronizes the clocks
+SYNC_INTERVAL = 10.0
+# seconds after which an idle period (blank/ITI screen) resynchronizes the clocks
+IDLE_SYNC_AGE = 2.0
+# worst case drift (ppm) between the stimulus and amp clocks, for the sync uncertainty
+CLOCK_DRIFT_PPM = 50.0
+
+
+def local_clock():
+    """egi.ms_localtime, the clock PyNetStation stamps events and syncs with."""
+    import egi.simple as egi
+    return egi.ms_localtime
+
+
+def local_ms():
+    """Local time in ms of time.time() modulo 1e6 s (so values wrap at 1e9 ms), like egi.ms_localtime."""
+    return int((time.time() % 1000000) * 1000)
+
+
+class SyncScheduler(object):
+    """
+    Syntax: SyncScheduler(connected egi.Netstation, interval=10, idle_age=2, drift_ppm=50)
+
+    Decides when to call ns.sync() and keeps the sync metrics. interval=0 syncs before every event (old behaviour).
+    The age of the last sync is timed on the monotonic timeit.default_timer: egi.ms_localtime wraps at 1e9 ms.
+    Not thread safe: use it from the thread that owns the socket (the AsyncSender thread, or the script).
+    """
+    def __init__(self, ns, interval=SYNC_INTERVAL, idle_age=IDLE_SYNC_AGE, drift_ppm=CLOCK_DRIFT_PPM):
+        self.ns = ns
+        self.interval = interval
+        self.idle_age = idle_age
+        self.drift_ppm = drift_ppm
+        self.last_sync = None
+        self.half_rtt = None
+        self.syncs = 0
+        self.total_cost = 0.0
+        self.max_cost = 0.0
+        self.last_cost = None
+
+    def sync(self):
+        """Calls ns.sync() now and records its cost (round-trip, ms)."""
+        start = default_timer()
+        self.ns.sync()
+        self.last_sync = default_timer()
+        cost = (self.last_sync - start) * 1000
+        self.half_rtt = cost / 2
+        self.syncs += 1
+        self.total_cost += cost
+        self.max_cost = max(self.max_cost, cost)
+        self.last_cost = cost
+
+    def age(self):
+        """ms since the last sync (None before the first one)."""
+        return None if self.last_sync is None else (default_timer() - self.last_sync) * 1000
+
+    def before_event(self):
+        """Syncs if the last sync is older than interval; returns True if it synced."""
+        age = self.age()
+        if age is None or age >= self.interval * 1000:
+            self.sync()
+            return True
+        return False
+
+    def idle(self):
+        """Syncs during an idle period if the last sync is older than idle_age; returns True if it synced."""
+        age = self.age()
+        if age is None or age >= self.idle_age * 1000:
+            self.sync()
+            return True
+        return False
+
+    def uncertainty(self):
+        """Bound (ms) on the alignment error now: half the sync round-trip + drift since the sync."""
+        if self.last_sync is None:
+            return None
+        return self.half_rtt + self.age() * self.drift_ppm * 1e-6
+
+    def metrics(self):
+        """Dict of sync count, cost (last / mean / max ms), age (ms), half_rtt (half the last round-trip, ms) and uncertainty (ms)."""
+        return {'syncs': self.syncs, 'last_cost': self.last_cost, 'max_cost': self.max_cost,
+                'mean_cost': self.total_cost / self.syncs if self.syncs else None,
+                'age': self.age(), 'half_rtt': self.half_rtt, 'uncertainty': self.uncertainty()}
+
+
+class AsyncSender(object):
+    """
+    Syntax: AsyncSender(connected egi.Netstation, clock=egi.ms_localtime, scheduler=None, log=None)
+
+    Background thread sending queued events to NetStation. clock() returns the local time in ms.
+    The sender thread syncs the clocks through scheduler (default: SyncScheduler(ns)).
+    Errors on the sender thread are counted and kept in last_error instead of stopping the experiment.
+    Events acknowledged by NetStation are recorded in log (a pyns_evlog.EventLog) if given.
+    """
+    def __init__(self, ns, clock=None, scheduler=None, log=None):
+        self.ns = ns
+        self.clock = clock if clock is not None else local_clock()
+        self.scheduler = scheduler if scheduler is not None else SyncScheduler(ns)
+        self.log = log
+        self.queue = collections.deque()
+        self.wake = threading.Event()
+        self.running = False
+        self.thread = None
+        self.sent = 0
+        self.errors = 0
+        self.last_error = None
+        self.max_queue = 0
+
+    def start(self):
+        """Starts the sender thread; from now on only that thread uses the socket."""
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name='pyns-sender')
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def send(self, key, timestamp=None, frame=None, flip=False, **kwargs):
+        """
+        Example: sender.send('sbli', frame=frameN)
+
+        Queues one event stamped now (or at timestamp, local ms). kwargs are passed to ns.send_event
+        (ie. label, description, table); frame and flip (timestamp is a flip time) only go to the log.
+        Returns the timestamp.
+        """
+        if timestamp is None:
+            timestamp = self.clock()
+        self.queue.append((str(key), timestamp, kwargs, (default_timer(), frame, flip)))
+        self.wake.set()
+        return timestamp
+
+    def send_on_flip(self, win, key, **kwargs):
+        """
+        Example: sender.send_on_flip(win, 'wsqS')
+
+        Queues key at the next win.flip() instead of now. win.callOnFlip runs send() right after the buffer swap,
+        so the event carries the time the frame reached the screen rather than the time it was prepared;
+        the network work stays on the sender thread.
+        """
+        win.callOnFlip(self.send, key, flip=True, **kwargs)
+
+    def call(self, method, *args):
+        """Queues ns.<method>(*args), run by the sender thread in order with the events."""
+        self.queue.append((None, getattr(self.ns, method), args, None))
+        self.wake.set()
+
+    def idle(self):
+        """Tells the sender thread the experiment is idle (blank/ITI screen), a good time to resync."""
+        self.queue.append((None, self.scheduler.idle, (), None))
+        self.wake.set()
+
+    def run(self):
+        """Sender thread: drains the queue until close()."""
+        while self.running or self.queue:
+            if not self.queue:
+                self.wake.wait(IDLE_WAIT)
+                self.wake.clear()
+                continue
+            self.max_queue = max(self.max_queue, len(self.queue))
+            # events are (key, timestamp, send_event kwargs, (call time, frame, flip)), commands (None, function, args, None)
+            key, timestamp, extra, origin = self.queue.popleft()
+            try:
+                if key is None:
+                    timestamp(*extra)
+                    continue
+                self.scheduler.before_event()
+                self.ns.send_event(key=key, timestamp=timestamp, pad=False, **extra)
+                self.sent += 1
+                if self.log is not None:
+                    called, frame, flip = origin
+                    self.log.event(key, timestamp, frame, timestamp if flip else None,
+                                   round((default_timer() - called) * 1000, 3))
+            except Exception as error:
+                self.errors += 1
+                self.last_error = error
+
+    def close(self, timeout=CLOSE_TIMEOUT):
+        """Sends the queued events (waiting at most timeout seconds) and stops the thread."""
+        self.running = False
+        self.wake.set()
+        if self.thread is not None:
+            self.thread.join(timeout)
+        if self.queue:
+            print('WARNING: ' + str(len(self.queue)) + ' NetStation events were not sent')
+        if self.errors:
+            print('WARNING: ' + str(self.errors) + ' NetStation sends failed, last error: ' + repr(self.last_error))
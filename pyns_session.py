@@ -0,0 +1,134 @@
+"""
+In-process sessions so PsychoPy/NetStation logs are parsed once and shared by all analyses.
+
+A PynsSession holds one PsychoPy log and one NetStation event export.
+Each source is parsed lazily on first use (through the pyns_cache disk cache) and kept in memory,
+so pyns_diff followed by pyns_pc on the same logs parses each file once.
+
+open_session keeps the MAX_SESSIONS most recently used sessions resident (LRU),
+and replaces a session whose log files changed on disk.
+
+Example:
+	session = open_session('example_pylog', 'example_nslog')
+	diff_py, diff_ns, avg = session.diff('data', 'int', 'bli', 'sbl')
+	fit = session.clock('data', 'int', 'bli', 'sbl')    # {'offset', 'drift_ppm', 'residual_scale', 'residual_max'}
+	avg_pypc, avg_nspc = session.pc('wsq', 'sbl', 'scl', 'sop')
+"""
+import os
+from collections import OrderedDict
+import pyns_core as pyns
+from pyns_align import fit_clock
+from pyns_match import match_tables
+
+#number of sessions kept resident by open_session
+MAX_SESSIONS=8
+SESSIONS=OrderedDict()
+
+
+def file_stamp(path):
+	"""(size, mtime) of path, used to notice changed logs."""
+	stat=os.stat(path)
+	return stat.st_size,stat.st_mtime
+
+
+class PynsSession(object):
+	"""
+	Syntax: PynsSession(string of PsychoPy log w/o extension, string of NetStation event log, cache=True)
+
+	Lazily parsed PsychoPy/NetStation log pair exposing both analyses of pyns_run as methods.
+	cache=True reads the logs through the pyns_cache disk cache.
+	"""
+	def __init__(self,pylog,nslog,cache=True):
+		self.pylog=str(pylog)
+		self.nslog=str(nslog)
+		self.cache=cache
+		self.stamp=self.current_stamp()
+		self._pytables={}
+		self._nstable=None
+		self._paired={}
+
+	def current_stamp(self):
+		"""File stamps of both logs."""
+		return file_stamp(self.pylog + '.log'),file_stamp(self.nslog)
+
+	def pytable(self,filter_py='data'):
+		"""EventTable of the PsychoPy log for the level filter_py, parsed on first use."""
+		level=str(filter_py).lower()
+		if level not in self._pytables:
+			self._pytables[level]=pyns.filter_pylog(self.pylog,level,self.cache)
+		return self._pytables[level]
+
+	@property
+	def nstable(self):
+		"""EventTable of the NetStation event export, parsed on first use."""
+		if self._nstable is None:
+			self._nstable=pyns.filter_nslog(self.nslog,self.cache)
+		return self._nstable
+
+	def paired(self,filter_py='data',*event_tags):
+		"""
+		(PsychoPy events, NetStation events) of event_tags, in pairs. If the logs hold a different number
+		of events, only the events matched by pyns_match.match_tables are kept and the unmatched ones are reported.
+		"""
+		key=(str(filter_py).lower(),event_tags)
+		if key not in self._paired:
+			py_event=pyns.filter_pyevent(self.pytable(filter_py),*event_tags)
+			ns_event=pyns.filter_nsevent(self.nstable,*event_tags)
+			if len(py_event) != len(ns_event):
+				match=match_tables(py_event,ns_event)
+				print("WARNING: " + str(len(py_event)) + " Py events vs " + str(len(ns_event)) + " NS events; comparing " +
+					str(len(match.py)) + " matched (unmatched Py: " + str(len(match.unmatched_py)) +
+					", unmatched NS: " + str(len(match.unmatched_ns)) + ")")
+				py_event,ns_event=py_event.take(match.py),ns_event.take(match.ns)
+			self._paired[key]=py_event,ns_event
+		return self._paired[key]
+
+	def diff(self,filter_py='data',*event_tags):
+		"""
+		Example: session.diff('data','int','ope','clo','gaz','end')
+
+		PY-NS timing comparison of pyns_run.pyns_diff on the paired events. Returns (diff_py, diff_ns, average).
+		"""
+		py_event,ns_event=self.paired(filter_py,*event_tags)
+		diff_py=pyns.timediff_py(py_event)
+		diff_ns=pyns.timediff_ns(ns_event)
+		return diff_py,diff_ns,pyns.average_diff(diff_py,diff_ns)
+
+	def clock(self,filter_py='data',*event_tags):
+		"""
+		Example: session.clock('data','int','ope','clo','gaz','end')
+
+		Robust clock fit (pyns_align.fit_clock) on the paired events. Returns a dict of the offset (ms),
+		drift_ppm, residual_scale and residual_max (ms, largest absolute residual); all None below two pairs.
+		"""
+		py_event,ns_event=self.paired(filter_py,*event_tags)
+		if len(py_event) < 2:
+			return {'offset':None,'drift_ppm':None,'residual_scale':None,'residual_max':None}
+		fit=fit_clock(py_event.onset,ns_event.onset)
+		return {'offset':round(float(fit.offset),3),'drift_ppm':round(float(fit.drift_ppm),3),
+			'residual_scale':round(float(fit.scale),3),'residual_max':round(float(abs(fit.residual).max()),3)}
+
+	def pc(self,pypc_tag='wsq',*event_tags):
+		"""
+		Example: session.pc('wsq','ope','clo','gaz')
+
+		Photocell timing of pyns_run.pyns_pc. Returns (average PsychoPy photocell diff, average NetStation photocell diff).
+		"""
+		return pyns.photocell_py(self.pytable('data'),pypc_tag,*event_tags),pyns.photocell_ns(self.nstable,*event_tags)
+
+
+def open_session(pylog,nslog,cache=True):
+	"""
+	Syntax: open_session(string of PsychoPy log w/o extension, string of NetStation event log)
+
+	Returns the resident PynsSession of this log pair, creating it if needed (or if a log changed).
+	Only the MAX_SESSIONS most recently used sessions are kept.
+	"""
+	key=(os.path.abspath(str(pylog)),os.path.abspath(str(nslog)),cache)
+	session=SESSIONS.pop(key,None)
+	if session is None or session.stamp != session.current_stamp():
+		session=PynsSession(pylog,nslog,cache)
+	SESSIONS[key]=session
+	while len(SESSIONS) > MAX_SESSIONS:
+		SESSIONS.popitem(last=False)
+	return session
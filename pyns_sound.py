@@ -0,0 +1,120 @@
+"""
+Sound bank: every cue WAV decoded once, in the background, and handed out by name.
+
+setSound('./sound/*.wav') at the start of a block reads and decodes the file again right before the
+timed cue. SoundBank decodes all the .wav files of a folder into numpy buffers on a background thread
+(ie. while the instructions are on screen); sound(name) then builds the PsychoPy Sound from memory
+once and returns the same object for every block, without touching the disk.
+
+Example:
+    bank = SoundBank('sound').start()     # before the instruction screen
+    ...
+    bank.wait()
+    sbli = bank.sound('blink_speak')
+    print(bank.report())                  # load time (ms) and memory (bytes) of every file
+"""
+from __future__ import division, print_function
+import glob
+import os
+import threading
+import wave
+from timeit import default_timer
+import numpy as np
+
+# numpy type of the samples for each WAV sample width (24 bit samples are widened to int32)
+SAMPLE_TYPES = {1: np.uint8, 2: np.int16, 4: np.int32}
+
+
+def read_wav(path):
+    """(samples as float32 in [-1, 1], shape (frames,) or (frames, channels), sample rate) of a PCM WAV file."""
+    wav = wave.open(path, 'rb')
+    try:
+        channels, width, rate, n_frames = wav.getnchannels(), wav.getsampwidth(), wav.getframerate(), wav.getnframes()
+        data = wav.readframes(n_frames)
+    finally:
+        wav.close()
+    if width == 3:
+        raw = np.frombuffer(data, dtype=np.uint8).reshape(-1, 3)
+        samples = (raw[:, 0].astype(np.int32) << 8 | raw[:, 1].astype(np.int32) << 16 |
+                   raw[:, 2].astype(np.int32) << 24)
+        width = 4
+    else:
+        samples = np.frombuffer(data, dtype=SAMPLE_TYPES[width])
+    if width == 1:
+        samples = (samples.astype(np.float32) - 128) / 128
+    else:
+        samples = samples.astype(np.float32) / float(2 ** (8 * width - 1))
+    if channels > 1:
+        samples = samples.reshape(-1, channels)
+    return samples, rate
+
+
+class SoundBank(object):
+    """
+    Syntax: SoundBank('folder of .wav files', volume=1)
+
+    Decodes folder/*.wav on start() (background thread) and returns one PsychoPy Sound per file stem.
+    """
+    def __init__(self, folder='sound', volume=1):
+        self.folder = folder
+        self.volume = volume
+        self.buffers = {}
+        self.sounds = {}
+        self.load_ms = {}
+        self.total_ms = None
+        self.error = None
+        self.thread = None
+
+    def start(self):
+        """Starts decoding on a background thread; returns the bank."""
+        self.thread = threading.Thread(target=self.load, name='pyns-sounds')
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def load(self):
+        """Decodes every .wav file of the folder into self.buffers (runs on the loader thread)."""
+        start = default_timer()
+        try:
+            for path in sorted(glob.glob(os.path.join(self.folder, '*.wav'))):
+                began = default_timer()
+                name = os.path.splitext(os.path.basename(path))[0]
+                self.buffers[name] = read_wav(path)
+                self.load_ms[name] = (default_timer() - began) * 1000
+        except Exception as error:
+            self.error = error
+        self.total_ms = (default_timer() - start) * 1000
+
+    def wait(self):
+        """Blocks until every file is decoded (decodes here if start() was not called)."""
+        if self.thread is None:
+            self.load()
+        else:
+            self.thread.join()
+        if self.error is not None:
+            raise self.error
+        return self
+
+    def sound(self, name):
+        """
+        Example: bank.sound('blink_speak')
+
+        The PsychoPy Sound of folder/name.wav, built from the decoded buffer on first use.
+        """
+        if name not in self.sounds:
+            from psychopy import sound
+            samples, rate = self.wait().buffers[name]
+            cue = sound.Sound(samples, sampleRate=rate, stereo=samples.ndim > 1, name=name)
+            cue.setVolume(self.volume)
+            self.sounds[name] = cue
+        return self.sounds[name]
+
+    def memory(self):
+        """Bytes held by the decoded buffers."""
+        return sum(samples.nbytes for samples, rate in self.buffers.values())
+
+    def report(self):
+        """{'files', 'load_ms' (total), 'bytes', 'per_file': {name: (ms, bytes)}} of the decoded sounds."""
+        return {'files': len(self.buffers), 'load_ms': round(self.total_ms or 0, 3), 'bytes': self.memory(),
+                'per_file': dict((name, (round(self.load_ms[name], 3), samples.nbytes))
+                                 for name, (samples, rate) in self.buffers.items())}
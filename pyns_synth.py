@@ -0,0 +1,84 @@
+"""
+Synthetic PsychoPy logs and NetStation event exports for benchmarks and offline tests.
+
+write_session writes a <stem>.log PsychoPy log and a <stem>_nslog NetStation export laid out like
+example_pylog.log / example_nslog:
+	- DATA rows 'sbli | frame count: N' for every event, plus a 'wsqS' photocell row for a share of them
+	- exp_ratio EXP noise rows (long object reprs, some spanning several lines) per DATA row
+	- NS rows for the same events on the amp clock (own start, linear drift in ppm, random jitter),
+	  plus a DIN3 row ~370 ms after the event for the photocell events
+Everything is drawn from a seeded RandomState, so a given set of arguments always writes the same files.
+
+Example: pylog, nslog = write_session('/tmp/synth', 10000, exp_ratio=40)
+"""
+from __future__ import division
+import numpy as np
+
+TAGS=['sbli','sclo','sope','slef','srig','s_up','sdow']
+EXP_NOISE=[
+	"Created window1 = Window(allowGUI=False, allowStencil=False, args=UNKNOWN, autoLog=True, bitsMode=UNKNOWN, "
+	"blendMode='avg', color=array([-1., -1., -1.]), colorSpace='rgb', fullscr=UNKNOWN, gamma=None, kwargs=UNKNOWN, "
+	"monitor=<psychopy.monitors.calibTools.Monitor object at 0x113b74790>, multiSample=False, name='window1')",
+	"center: vertices = array([[-0.25,  0.25],\n       [ 0.25,  0.25],\n       [ 0.25, -0.25],\n       [-0.25, -0.25]])",
+	"whitesquare: autoDraw = True",
+	"Set  sbli sound=./sound/blink_speak.wav",
+	"intro_text: text = u'Hello,\\n\\nA sound will be played, instructing what to do.'",
+]
+#NetStation times are '_HH:MM:SS.mmm', so a recording has to stay under 100 hours
+MAX_NS_MS=99*3600000+59*60000+59999
+NS_ROW="%s\t\tStimulus Event\t%s\t_%02d:%02d:%02d.%03d\t_00:00:00.001\t\n"
+
+
+def ns_time(ms):
+	"""(HH, MM, SS, mmm) of an integer millisecond onset."""
+	return ms//3600000,ms//60000 % 60,ms//1000 % 60,ms % 1000
+
+
+def write_session(stem,n_events,exp_ratio=400,din_ratio=0.7,isi=1500.0,jitter=2.0,drift_ppm=20.0,
+		ns_start=200.0,pc_latency=370.0,seed=0,chunk=10000):
+	"""
+	Syntax: write_session('path stem', number of events, exp_ratio=400, din_ratio=0.7, isi=1500, jitter=2, drift_ppm=20, ...)
+	Example: write_session('/tmp/synth', 1000)
+
+	Writes stem + '.log' and stem + '_nslog' and returns (stem, stem + '_nslog'),
+	ready for filter_pylog(stem, 'data') and filter_nslog(stem + '_nslog').
+	isi: mean ms between events, jitter: sd (ms) of the NS onset noise,
+	din_ratio: share of events followed by a photocell flash (wsqS / DIN3).
+	"""
+	rng=np.random.RandomState(seed)
+	py_onset=1000.0+np.cumsum(rng.uniform(0.5*isi,1.5*isi,n_events))
+	#amp clock: recording starts ns_start ms before the first event, runs drift_ppm fast, plus jitter
+	ns_onset=np.round(ns_start+(py_onset-py_onset[:1])*(1+drift_ppm*1e-6)+
+		rng.normal(0,jitter,n_events)).astype(np.int64)
+	if n_events and ns_onset[-1]+pc_latency+1000 > MAX_NS_MS:
+		raise ValueError("recording longer than 99 hours: use a smaller isi for this many events")
+	tags=np.array(TAGS)[rng.randint(0,len(TAGS),n_events)]
+	has_pc=rng.rand(n_events) < din_ratio
+	py_pc=py_onset+pc_latency-40+rng.normal(0,3,n_events)
+	ns_pc=ns_onset+np.round(pc_latency+rng.normal(0,5,n_events)).astype(np.int64)
+	with open(str(stem) + '.log','w') as pyFile:
+		pyFile.write('%.4f \tEXP \t%s\n' % (0.5,EXP_NOISE[0]))
+		for start in range(0,n_events,chunk):
+			end=min(start+chunk,n_events)
+			#noise lines are drawn per chunk: exp_ratio x n_events of them would not fit in memory for big sessions
+			first=int(exp_ratio*start)
+			noise=rng.randint(0,len(EXP_NOISE),int(exp_ratio*end)-first)
+			rows=[]
+			for i in range(start,end):
+				seconds=py_onset[i]/1000
+				for k in range(int(exp_ratio*i),int(exp_ratio*(i+1))):
+					rows.append('%.4f \tEXP \t%s\n' % (seconds-0.0005,EXP_NOISE[noise[k-first]]))
+				rows.append('%.4f \tDATA \t%s | frame count: %d\n' % (seconds,tags[i],int(py_onset[i]*0.06)))
+				if has_pc[i]:
+					rows.append('%.4f \tDATA \twsqS\n' % (py_pc[i]/1000))
+			pyFile.write(''.join(rows))
+	with open(str(stem) + '_nslog','w') as nsFile:
+		nsFile.write('Recording 1\nTime Mode: Relative Time\nCode\tLabel\tType\tTrack\tOnset\tDuration\n')
+		for start in range(0,n_events,chunk):
+			rows=[]
+			for i in range(start,min(start+chunk,n_events)):
+				rows.append(NS_ROW % ((tags[i],'ECI TCP/IP 55513')+ns_time(int(ns_onset[i]))))
+				if has_pc[i]:
+					rows.append(NS_ROW % (('DIN3','DIN 1')+ns_time(int(ns_pc[i]))))
+			nsFile.write(''.join(rows))
+	return str(stem),str(stem) + '_nslog'
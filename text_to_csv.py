@@ -4,25 +4,24 @@
 import csv
 """
 USE: text_to_csv('NS log name', 'PsychoPy log name') to convert"
+     text_to_csv('NS log name') converts NS log only (PsychoPy log is read directly by pyns_core.read_pylog)
 """
 ##change filename & filename2 accordingly
 ##creates csv file identical to filename
 
-def text_to_csv(filenameA, filenameB):
+def text_to_csv(filenameA, filenameB=None):
 #convert NetStation event log txt file to csv
 	txt_file = str(filenameA) #check extension
 	csv_file = str(filenameA) + ".csv"
 
-	in_txt = csv.reader(open(txt_file, "rb"), delimiter = '\t')
-	out_csv = csv.writer(open(csv_file, 'wb'))
-
-	out_csv.writerows(in_txt)
+	with open(txt_file, newline='') as txt, open(csv_file, 'w', newline='') as out:
+		csv.writer(out).writerows(csv.reader(txt, delimiter = '\t'))
 
 #convert PsychoPy log file to csv
+	if filenameB is None:
+		return
 	txt_file = str(filenameB) + ".log" #check extension
 	csv_file = str(filenameB) + ".csv"
 
-	in_txt = csv.reader(open(txt_file, "rb"), delimiter = '\t')
-	out_csv = csv.writer(open(csv_file, 'wb'))
-
-	out_csv.writerows(in_txt)
+	with open(txt_file, newline='') as txt, open(csv_file, 'w', newline='') as out:
+		csv.writer(out).writerows(csv.reader(txt, delimiter = '\t'))